@@ -0,0 +1,263 @@
+import numpy as np
+
+from tetrisengine import TetrisGame, Key, SRS_Minos, SevenBagRandomizer
+
+'''
+NumPy batch simulator: N independent games stepped in lockstep.
+Requires numpy (the rest of PyTris does not).
+
+Each board is a row of a (N, dim_y) uint16 array of row masks, with the same
+bit layout as BitboardMatrix. Shapes and kicks are built from the
+SRS_Tetrimino classes in tetrisengine, so results match the scalar engine:
+a BatchSimulator board stepped with actions a1,a2,... ends up with the same
+rows and active mino as TetrisGame(seed=...).step((a1,),0), step((a2,),0)...
+
+Time is not simulated - there is no gravity or lock delay, and
+minos only lock on DROP_HARD. A board whose next mino cannot spawn
+is topped out, and ignores further actions.
+Only locked cell occupancy is tracked, not block sources.
+
+Usage example:
+
+sim=BatchSimulator(1000,seeds=range(1000))
+actions=np.full(1000,Key.DROP_HARD.value)
+lines=sim.step(actions)
+'''
+
+# Action code for "do nothing". Other actions are Key enum values.
+NO_ACTION=0
+
+# Pieces, indexed the same way as BatchSimulator.piece
+PIECES=SRS_Minos
+_piece_index={cls:i for i,cls in enumerate(PIECES)}
+
+_MAX_ROWS=4  # Max number of rows a compiled shape spans
+_MAX_KICKS=max((len(kicks) for cls in PIECES for kicks in cls.compiled_kicks().values()))
+_ROTATIONS=(+1,-1,2) # Kick table direction index -> rotation delta
+
+
+def _build_shape_tables():
+    P=len(PIECES)
+    dy=np.zeros((P,4,_MAX_ROWS),dtype=np.int64)
+    mask=np.zeros((P,4,_MAX_ROWS),dtype=np.int64)
+    bbox=np.zeros((P,4,4),dtype=np.int64) # xmin,xmax,ymin,ymax
+    for p,cls in enumerate(PIECES):
+        for r,cshape in enumerate(cls.compiled_shapes()):
+            for s,(row_dy,row_mask) in enumerate(cshape.row_masks):
+                dy[p,r,s]=row_dy
+                mask[p,r,s]=row_mask
+            bbox[p,r]=(cshape.xmin,cshape.xmax,cshape.ymin,cshape.ymax)
+    return dy,mask,bbox
+
+def _build_kick_tables():
+    # kicks[p, from rotation, direction (0=cw, 1=ccw, 2=180), kick index] = (dx,dy)
+    # Missing kicks are flagged in kick_valid.
+    P=len(PIECES)
+    kicks=np.zeros((P,4,len(_ROTATIONS),_MAX_KICKS,2),dtype=np.int64)
+    kick_valid=np.zeros((P,4,len(_ROTATIONS),_MAX_KICKS),dtype=bool)
+    for p,cls in enumerate(PIECES):
+        compiled=cls.compiled_kicks()
+        for r in range(4):
+            for d,rot in enumerate(_ROTATIONS):
+                for k,kick in enumerate(compiled[(r,(r+rot)%4)]):
+                    kicks[p,r,d,k]=kick
+                    kick_valid[p,r,d,k]=True
+    return kicks,kick_valid
+
+_shape_dy,_shape_mask,_shape_bbox=_build_shape_tables()
+_kicks,_kick_valid=_build_kick_tables()
+
+
+class BatchSimulator():
+    '''
+    N games of Tetris stepped together with vectorized operations.
+    Public arrays (read-only by convention), indexed by board:
+        .rows = (N, dim_y) uint16 row masks of the locked blocks
+        .piece .rotation .x .y = active mino (piece indexes PIECES)
+        .held = held piece index, or -1
+        .topped_out = bool
+    '''
+    def __init__(self,n,seeds=None,dim_x=10,dim_y=20,queue_length=70):
+        if dim_x>16:
+            raise ValueError("BatchSimulator supports boards up to 16 wide")
+        if seeds is None:
+            seeds=[None]*n
+        seeds=list(seeds)
+        if len(seeds)!=n:
+            raise ValueError("Need exactly one seed per board")
+
+        self._n=n
+        self._dim_x=dim_x
+        self._dim_y=dim_y
+        self._full_row=(1<<dim_x)-1
+
+        self.rows=np.zeros((n,dim_y),dtype=np.uint16)
+        self.piece=np.zeros(n,dtype=np.int64)
+        self.rotation=np.zeros(n,dtype=np.int64)
+        self.x=np.zeros(n,dtype=np.int64)
+        self.y=np.zeros(n,dtype=np.int64)
+        self.held=np.full(n,-1,dtype=np.int64)
+        self.hold_avail=np.ones(n,dtype=bool)
+        self.topped_out=np.zeros(n,dtype=bool)
+
+        # Upcoming pieces, pregenerated in bulk from each board's own bag.
+        self._randomizers=[SevenBagRandomizer(seed) for seed in seeds]
+        self._queue_length=queue_length
+        self._queue=np.zeros((n,queue_length),dtype=np.int64)
+        self._queue_pos=np.zeros(n,dtype=np.int64)
+        for i in range(n):
+            self._refill_queue(i)
+
+        self._spawn(np.arange(n),self._next_pieces(np.arange(n)))
+
+    @property
+    def n(self):
+        return self._n
+
+    @property
+    def seeds(self):
+        return tuple((r.seed for r in self._randomizers))
+
+    def _refill_queue(self,i):
+        self._queue[i]=[_piece_index[cls] for cls in self._randomizers[i].take(self._queue_length)]
+        self._queue_pos[i]=0
+
+    def _next_pieces(self,idx):
+        for i in idx[self._queue_pos[idx]>=self._queue_length]:
+            self._refill_queue(i)
+        res=self._queue[idx,self._queue_pos[idx]]
+        self._queue_pos[idx]+=1
+        return res
+
+    def next_queue(self,i,n=5):
+        '''
+        Upcoming piece indexes of board i.
+        '''
+        pos=self._queue_pos[i]
+        res=tuple((int(p) for p in self._queue[i,pos:pos+n]))
+        if len(res)<n:
+            # Not enough left - peek into the randomizer.
+            res+=tuple((_piece_index[cls] for cls in self._randomizers[i].peek(n-len(res))))
+        return res
+
+    def fits(self,idx,piece,rotation,x,y):
+        '''
+        For each board in idx, whether the given mino placement
+        is inside the matrix and does not overlap any locked block.
+        '''
+        bbox=_shape_bbox[piece,rotation]
+        ok=((x+bbox[:,0]>=0)&(x+bbox[:,1]<self._dim_x)&
+            (y+bbox[:,2]>=0)&(y+bbox[:,3]<self._dim_y))
+        sx=np.clip(x+bbox[:,0],0,self._dim_x)
+        for s in range(_MAX_ROWS):
+            yy=np.clip(y+_shape_dy[piece,rotation,s],0,self._dim_y-1)
+            occupied=self.rows[idx,yy].astype(np.int64)
+            ok&=(occupied&(_shape_mask[piece,rotation,s]<<sx))==0
+        return ok
+
+    def _fits_active(self,idx,dx=0,dy=0,rotation=None):
+        if rotation is None:
+            rotation=self.rotation[idx]
+        return self.fits(idx,self.piece[idx],rotation,self.x[idx]+dx,self.y[idx]+dy)
+
+    def _move(self,idx,dx):
+        ok=self._fits_active(idx,dx=dx)
+        self.x[idx[ok]]+=dx
+
+    def _rotate(self,idx,rot):
+        direction=_ROTATIONS.index(rot)
+        old_rotation=self.rotation[idx]
+        new_rotation=(old_rotation+rot)%4
+        piece=self.piece[idx]
+        pending=np.ones(len(idx),dtype=bool)
+        for k in range(_MAX_KICKS):
+            valid=pending&_kick_valid[piece,old_rotation,direction,k]
+            kick=_kicks[piece,old_rotation,direction,k]
+            ok=valid&self.fits(idx,piece,new_rotation,
+                               self.x[idx]+kick[:,0],self.y[idx]+kick[:,1])
+            moved=idx[ok]
+            self.x[moved]+=kick[ok,0]
+            self.y[moved]+=kick[ok,1]
+            self.rotation[moved]=new_rotation[ok]
+            pending&=~ok
+
+    def _drop(self,idx):
+        while idx.size:
+            idx=idx[self._fits_active(idx,dy=-1)]
+            self.y[idx]-=1
+
+    def _lock(self,idx):
+        '''
+        Lock the active minos of idx, clear full rows, and return
+        the number of lines cleared on each board.
+        '''
+        piece=self.piece[idx]
+        rotation=self.rotation[idx]
+        sx=self.x[idx]+_shape_bbox[piece,rotation,0]
+        for s in range(_MAX_ROWS):
+            mask=_shape_mask[piece,rotation,s]
+            has_row=mask!=0
+            yy=self.y[idx]+_shape_dy[piece,rotation,s]
+            self.rows[idx[has_row],yy[has_row]]|=(mask[has_row]<<sx[has_row]).astype(np.uint16)
+
+        full=self.rows[idx]==self._full_row
+        cleared=full.sum(axis=1)
+        any_cleared=cleared>0
+        if any_cleared.any():
+            sel=idx[any_cleared]
+            # Stable sort moves the full rows to the top, keeping the rest in order.
+            order=np.argsort(full[any_cleared],axis=1,kind="stable")
+            newrows=np.take_along_axis(self.rows[sel],order,axis=1)
+            newrows[np.arange(self._dim_y)[None,:]>=(self._dim_y-cleared[any_cleared])[:,None]]=0
+            self.rows[sel]=newrows
+        return cleared
+
+    def _spawn(self,idx,pieces):
+        self.piece[idx]=pieces
+        self.rotation[idx]=0
+        self.x[idx]=TetrisGame.spawn_coords[0]
+        self.y[idx]=TetrisGame.spawn_coords[1]
+        self.topped_out[idx]|=~self._fits_active(idx)
+
+    def _hold(self,idx):
+        idx=idx[self.hold_avail[idx]]
+        current=self.piece[idx].copy()
+        held=self.held[idx]
+        pieces=held.copy()
+        from_bag=held<0
+        if from_bag.any():
+            pieces[from_bag]=self._next_pieces(idx[from_bag])
+        self._spawn(idx,pieces)
+        self.held[idx]=current
+        self.hold_avail[idx]=False
+
+    def step(self,actions):
+        '''
+        Apply one action to every board.
+        actions is a length N sequence of Key values, or NO_ACTION.
+        Returns the number of lines cleared on each board.
+        '''
+        actions=np.asarray(actions)
+        if actions.shape!=(self._n,):
+            raise ValueError("Need exactly one action per board")
+        lines=np.zeros(self._n,dtype=np.int64)
+        active=~self.topped_out
+
+        def boards(ktype):
+            return np.flatnonzero(active&(actions==ktype.value))
+
+        self._move(boards(Key.MOVE_LEFT),-1)
+        self._move(boards(Key.MOVE_RIGHT),+1)
+        self._rotate(boards(Key.ROTATE_RIGHT),+1)
+        self._rotate(boards(Key.ROTATE_LEFT),-1)
+        self._rotate(boards(Key.ROTATE_180),2)
+        self._drop(boards(Key.DROP_FIRM))
+
+        idx=boards(Key.DROP_HARD)
+        self._drop(idx)
+        lines[idx]=self._lock(idx)
+        self._spawn(idx,self._next_pieces(idx))
+        self.hold_avail[idx]=True
+
+        self._hold(boards(Key.HOLD))
+        return lines
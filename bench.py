@@ -0,0 +1,292 @@
+import argparse
+import contextlib
+import curses
+import json
+import platform
+import sys
+import time
+from unittest import mock
+
+import curseyou
+import pytris
+import tetrisengine
+from tetrisengine import TetrisGame, Playfield, SRS_T, SRS_I, SRS_J
+
+'''
+Microbenchmarks for the engine and renderer hot paths.
+Each benchmark times one operation in isolation, on a fixed board,
+and reports the best per-call time over several repeats.
+
+To run:
+python3 bench.py                            # print results
+python3 bench.py --save bench.json          # also store them as JSON
+python3 bench.py --baseline bench.json      # flag regressions against a saved run
+python3 bench.py -k line_clear              # only benchmarks matching a substring
+
+Exits with status 1 if any benchmark is slower than the baseline by more than --threshold.
+'''
+
+# Every benchmark is a function that builds its fixtures and returns
+# a callable timing exactly one operation.
+# A benchmark can also have a context: a function returning a context manager
+# that is entered around both building and timing it.
+benchmarks={}
+contexts={}
+
+def benchmark(name,context=None):
+    def register(f):
+        benchmarks[name]=f
+        if context is not None:
+            contexts[name]=context
+        return f
+    return register
+
+
+def _cannon_playfield():
+    pf=Playfield(10,20)
+    pf.force_matrix_state(tetrisengine._test_DT_cannon_r2d)
+    return pf
+
+def _mino_on(pf,piece_class,coords,rotation=0):
+    mino=piece_class(coords,rotation)
+    pf.add_activemino(mino)
+    return mino
+
+def _kicked_rotation(pf,piece_class,rot):
+    '''
+    First state on pf from which rotating by rot only succeeds with a kick.
+    '''
+    ms=pf.get_bitboard()
+    probe=piece_class((0,0),0)
+    probe.link_to_playfield(pf)
+    for r in range(4):
+        for y in range(ms.y):
+            for x in range(ms.x):
+                if not ms.fits(piece_class.compiled_shapes()[r],x,y):
+                    continue
+                if ms.fits(piece_class.compiled_shapes()[(r+rot)%4],x,y):
+                    continue
+                probe._coords,probe._rotation=(x,y),r
+                probe._rotate(rot,0)
+                if probe.rotation!=r:
+                    return (x,y),r
+    raise RuntimeError("No kicked rotation on this board")
+
+
+@benchmark("try_move")
+def bench_try_move():
+    pf=_cannon_playfield()
+    mino=_mino_on(pf,SRS_T,TetrisGame.spawn_coords)
+    start=mino.coords
+    def run():
+        mino._coords=start
+        mino._try_move(+1,0,0)
+    return run
+
+@benchmark("rotate_kick")
+def bench_rotate_kick():
+    pf=_cannon_playfield()
+    coords,rotation=_kicked_rotation(pf,SRS_T,+1)
+    mino=_mino_on(pf,SRS_T,coords,rotation)
+    def run():
+        mino._coords,mino._rotation=coords,rotation
+        mino._rotate(+1,0)
+    return run
+
+@benchmark("is_immobile")
+def bench_is_immobile():
+    pf=_cannon_playfield()
+    mino=_mino_on(pf,SRS_T,TetrisGame.spawn_coords)
+    mino.firm_drop(0)
+    return mino.is_immobile
+
+@benchmark("lock_mino")
+def bench_lock_mino():
+    # Includes resetting the board to a copy-on-write snapshot, and a new mino.
+    pf=_cannon_playfield()
+    base=pf.snapshot()
+    coords=(4,2)
+    def run():
+        pf._matrix=base.snapshot()
+        mino=SRS_J(coords,0)
+        pf.add_activemino(mino)
+        pf.lock_mino(mino)
+        pf.remove_activemino()
+    return run
+
+def _bench_line_clear(n):
+    def setup():
+        pf=Playfield(10,20)
+        r2d=tetrisengine._test_DT_cannon_r2d
+        for y in range(n):
+            # Fill rows above the cannon, so each check clears exactly n rows.
+            r2d=r2d.composite_p2ds(tetrisengine.Pixel2DSet.from_string("#"*10).translate(0,8+y))
+        pf.force_matrix_state(r2d)
+        base=pf.snapshot()
+        def run():
+            pf._matrix=base.snapshot()
+            pf.check_line_clear()
+        return run
+    return setup
+
+for _n in range(5):
+    benchmark(F"check_line_clear_{_n}")(_bench_line_clear(_n))
+
+@benchmark("get_matrix_state")
+def bench_get_matrix_state():
+    pf=_cannon_playfield()
+    _mino_on(pf,SRS_I,TetrisGame.spawn_coords)
+    def run():
+        pf.get_matrix_state(generate_ghost=True,include_active=True)
+    return run
+
+@benchmark("get_matrix_state_cold")
+def bench_get_matrix_state_cold():
+    # After the matrix changed: no cached view or ghost.
+    pf=_cannon_playfield()
+    _mino_on(pf,SRS_I,TetrisGame.spawn_coords)
+    def run():
+        pf._matrix_changed()
+        pf.get_matrix_state(generate_ghost=True,include_active=True)
+    return run
+
+@benchmark("get_nextpreview")
+def bench_get_nextpreview():
+    tg=TetrisGame(0.0,seed=0)
+    tg.update(0.0)
+    def run():
+        tg.get_nextpreview(4)
+    return run
+
+
+class _FakeScreen():
+    def addstr(self,y,x,s,attr):
+        pass
+    def refresh(self):
+        pass
+    def clear(self):
+        pass
+
+_fake_curses={
+    "LINES":30,"COLS":80,"COLORS":256,"COLOR_PAIRS":32767,
+    "update_lines_cols":lambda:None,
+    "init_pair":lambda n,fg,bg:None,
+    "color_pair":lambda n:n<<8,
+    }
+
+def _patch_curses():
+    # No real terminal is opened, so curses is stubbed out for CurseYou,
+    # and restored once the benchmark is done.
+    return mock.patch.multiple(curses,create=True,**_fake_curses)
+
+@benchmark("draw_frame",context=_patch_curses)
+def bench_draw_frame():
+    # Draw the matrix and commit it to a fake screen. Alternates between
+    # two positions of the active mino, so every commit has cells to send.
+    cy=curseyou.CurseYou(_FakeScreen(),use_256=True)
+    cy.register_styles(pytris.ui_palette)
+
+    pf=_cannon_playfield()
+    mino=_mino_on(pf,SRS_T,TetrisGame.spawn_coords)
+    frames=[]
+    for dx in (0,1):
+        mino._coords=(TetrisGame.spawn_coords[0]+dx,TetrisGame.spawn_coords[1])
+        frames.append(pf.get_matrix_state(generate_ghost=True,include_active=True))
+    sv=cy.subview(10,0)
+    state=[0]
+    def run():
+        state[0]^=1
+        pytris.draw_r2d_on_cy(sv,frames[state[0]])
+        cy.commit()
+    return run
+
+
+def measure(run,repeat=5,min_time=0.2):
+    '''
+    Best time per call in nanoseconds, over repeat runs
+    of at least min_time seconds each.
+    '''
+    number=1
+    while True:
+        start=time.perf_counter()
+        for i in range(number):
+            run()
+        elapsed=time.perf_counter()-start
+        if elapsed>=min_time:
+            break
+        number*=2
+    best=elapsed/number
+    for i in range(repeat-1):
+        start=time.perf_counter()
+        for j in range(number):
+            run()
+        best=min(best,(time.perf_counter()-start)/number)
+    return best*1e9,number
+
+
+def run_benchmarks(names,repeat=5,min_time=0.2):
+    results={}
+    for name in names:
+        with contexts.get(name,contextlib.nullcontext)():
+            ns,number=measure(benchmarks[name](),repeat,min_time)
+        results[name]={"ns_per_call":ns,"number":number}
+        print(F"{name:24} {ns/1000:10.2f} us/call",flush=True)
+    return results
+
+
+def compare(results,baseline,threshold):
+    '''
+    Print the change of each benchmark against baseline.
+    Returns the names of the ones slower by more than threshold (a fraction).
+    '''
+    regressions=[]
+    print()
+    print(F"{'benchmark':24} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name,res in results.items():
+        if name not in baseline:
+            print(F"{name:24} {'-':>10} {res['ns_per_call']/1000:10.2f}")
+            continue
+        old=baseline[name]["ns_per_call"]
+        change=res["ns_per_call"]/old-1
+        flag=""
+        if change>threshold:
+            flag=" REGRESSION"
+            regressions.append(name)
+        print(F"{name:24} {old/1000:10.2f} {res['ns_per_call']/1000:10.2f} {change*100:+7.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="PyTris microbenchmarks.")
+    parser.add_argument("-k",dest="filter",default="",
+                        help="Only run benchmarks whose name contains this")
+    parser.add_argument("--save",metavar="FILE",help="Write the results to FILE as JSON")
+    parser.add_argument("--baseline",metavar="FILE",help="Compare against results saved with --save")
+    parser.add_argument("--threshold",type=float,default=0.10,
+                        help="Slowdown that counts as a regression (default 0.10 = 10%%)")
+    parser.add_argument("--repeat",type=int,default=5)
+    parser.add_argument("--min-time",type=float,default=0.2,
+                        help="Minimum seconds per repeat")
+    args=parser.parse_args(argv)
+
+    names=[name for name in benchmarks if args.filter in name]
+    results=run_benchmarks(names,args.repeat,args.min_time)
+
+    if args.save is not None:
+        with open(args.save,"w") as f:
+            json.dump({"python":platform.python_version(),
+                       "platform":platform.platform(),
+                       "results":results},f,indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline=json.load(f)["results"]
+        regressions=compare(results,baseline,args.threshold)
+        if regressions:
+            print(F"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
 import curses
+import select
+import sys
 
 '''
 Thin-ish wrapper around the curses module.
@@ -22,10 +24,13 @@ class CurseYouEnvironment:
     '''
     Context manager for curses.
     When entered, setup curses environment, and return a CurseYou object.
+    Styles given in palette are registered on entry (see CurseYou.register_styles)
+    so their color pairs are not created in the middle of a frame.
     '''
-    def __init__(self, use_256color=False):
+    def __init__(self, use_256color=False, palette=()):
         self._stdscr=None
         self._256c=use_256color
+        self._palette=tuple(palette)
 
     def __enter__(self):
         stdscr=curses.initscr()
@@ -37,7 +42,9 @@ class CurseYouEnvironment:
         stdscr.nodelay(True)
         if self._256c and curses.COLORS<256:
             raise RuntimeError("256 colors not supported!")
-        return CurseYou(stdscr,use_256=self._256c)
+        cy=CurseYou(stdscr,use_256=self._256c)
+        cy.register_styles(self._palette)
+        return cy
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self._stdscr is not None:
@@ -53,6 +60,7 @@ class CYStyle:
     available members:
         .fg .bg = color constant e.g. CYStyle.WHITE or RGB tuple e.g. (0.3,0.0,1.0)
         .bold .dim .blink = boolean values.
+    Mutable. Use .freeze() to get an immutable, hashable CYFrozenStyle.
     '''
     WHITE   = curses.COLOR_WHITE
     BLACK   = curses.COLOR_BLACK
@@ -136,6 +144,83 @@ class CYStyle:
         else:
             self._remove_attr(curses.A_BLINK)
 
+    def key(self):
+        '''
+        Hashable tuple describing this style's current value.
+        '''
+        return (_color_key(self._fg),_color_key(self._bg),frozenset(self._attrs))
+
+    def freeze(self):
+        '''
+        Return an immutable, hashable copy of this style.
+        '''
+        return CYFrozenStyle._copy(self)
+
+
+class CYFrozenStyle(CYStyle):
+    '''
+    Immutable and hashable CYStyle. Create one with CYStyle.freeze(),
+    or directly with the same arguments as CYStyle.
+    CurseYou compiles each distinct frozen style to a curses attribute
+    only once, so prefer these for styles that are used every frame.
+    '''
+    def __init__(self,**kwargs):
+        self._frozen=False
+        super().__init__(**kwargs)
+        self._key=super().key()
+        self._frozen=True
+
+    @classmethod
+    def _copy(cls,style):
+        # Copies the attributes as they are: going through __init__ would
+        # reset bold, dim and blink to their defaults.
+        frozen=cls.__new__(cls)
+        frozen._fg=style._fg
+        frozen._bg=style._bg
+        frozen._attrs=set(style._attrs)
+        frozen._key=CYStyle.key(frozen)
+        frozen._frozen=True
+        return frozen
+
+    def _check_frozen(self):
+        if self._frozen:
+            raise AttributeError("CYFrozenStyle is immutable")
+    def _remove_attr(self,*attributes):
+        self._check_frozen()
+        super()._remove_attr(*attributes)
+    def _add_attr(self,*attributes):
+        self._check_frozen()
+        super()._add_attr(*attributes)
+
+    @CYStyle.fg.setter
+    def fg(self,v):
+        self._check_frozen()
+        self._fg=v
+    @CYStyle.bg.setter
+    def bg(self,v):
+        self._check_frozen()
+        self._bg=v
+
+    def key(self):
+        return self._key
+    def freeze(self):
+        # Already an immutable copy of itself, attributes included.
+        return self
+
+    def __eq__(self,other):
+        if not isinstance(other,CYFrozenStyle):
+            return NotImplemented
+        return self._key==other._key
+    def __hash__(self):
+        return hash(self._key)
+
+
+def _color_key(c):
+    # RGB colors may be given as lists.
+    if type(c)==list:
+        return tuple(c)
+    return c
+
 
 def _256c_to_rgb(n):
     assert 16<=n<=231
@@ -155,6 +240,11 @@ def _rgb_to_256c(r,g,b):
     assert 16<=res<=231
     return res
 
+_DEFAULT_STYLE=CYFrozenStyle()
+
+# Contents of an empty screen cell: (character, attribute bitfield)
+_BLANK_CELL=(" ",0)
+
 class TextOutOfBounds(BaseException):
     pass
 class InvalidTextError(BaseException):
@@ -203,6 +293,56 @@ class CYView():
             y+self._yoff,
             s,*args,**kwargs)
 
+    def blit(self,grid,x=0,y=0,palette=None):
+        '''
+        Write a 2D grid of cells, with its top-left corner at (x,y).
+        grid is either:
+          - a sequence of rows (top row first), each a sequence of
+            (text, style) cells. style is a CYStyle, or None for the default.
+          - a Raster2D-like object (.x, .y, and [x,y] access with y pointing up)
+            if palette is given. palette(cell) must return a (text, style) tuple.
+        All cells in a row are laid out left to right, each as wide as its text.
+        Bounds are checked once for the whole grid, and adjacent cells with
+        the same style are coalesced into a single write.
+        '''
+        if palette is not None:
+            r2d=grid
+            grid=[[palette(r2d[cx,cy]) for cx in range(r2d.x)]
+                  for cy in range(r2d.y-1,-1,-1)]
+
+        # Coalesce each row into runs of (x offset, text, style)
+        rows=[]
+        for row in grid:
+            runs=[]
+            run_x=0
+            run_text=[]
+            run_style=None
+            cx=0
+            for text,style in row:
+                if "\n" in text:
+                    raise InvalidTextError(F"{repr(text)} contains newlines.")
+                if run_text and style!=run_style:
+                    runs.append((run_x,"".join(run_text),run_style))
+                    run_text=[]
+                if not run_text:
+                    run_x=cx
+                    run_style=style
+                run_text.append(text)
+                cx+=len(text)
+            if run_text:
+                runs.append((run_x,"".join(run_text),run_style))
+            rows.append(runs)
+
+        width=max((r[-1][0]+len(r[-1][1]) for r in rows if r),default=0)
+        height=len(rows)
+        if width==0 or height==0:
+            return
+        if (not self.check_inbounds(x,y)) or (not self.check_inbounds(x+width-1,y+height-1)):
+            raise TextOutOfBounds(F"{width}x{height} grid at ({x},{y}) out of bounds on screen "+self.identify())
+
+        self._cy._blit_rows(x+self._xoff,y+self._yoff,rows,
+                            F"{width}x{height} grid")
+
     def subview(self,xdelta=0,ydelta=0,xsize=None,ysize=None):
         '''
         Create a "Sub-view" - a screen offset by a certain amount.
@@ -238,17 +378,41 @@ class CurseYou(CYView):
     '''
     Object used for managing the terminal.
     Do not initialize directly. Instead, use the one provided by CurseYouEnvironment.__enter__()
+
+    Writes go to a back buffer of (character, attribute) cells.
+    commit() compares it against what is currently on the screen,
+    and only sends the cells that changed.
     '''
     def __init__(self,scr,*,use_256=False):
         super().__init__(cy_object=self)
 
         self._colorpairs={}
         self._colorpair_next_index=1
+        self._attr_cache={} # CYStyle.key() -> attribute bitfield
         self._firstdraw=True
 
         self._scr=scr
         self._256c=use_256
 
+        self._lines=curses.LINES
+        self._cols=curses.COLS
+        self._front=self._blank_buffer() # What is on the screen now
+        self._back=self._front           # What the next commit() will show
+
+    def _blank_buffer(self):
+        return [[_BLANK_CELL]*self._cols for y in range(self._lines)]
+
+    def _begin_frame(self):
+        curses.update_lines_cols()
+        if (curses.LINES,curses.COLS)!=(self._lines,self._cols):
+            # Terminal resized - forget what we think is on the screen,
+            # and repaint everything on the next commit.
+            self._lines=curses.LINES
+            self._cols=curses.COLS
+            self._front=self._blank_buffer()
+            self._scr.clear()
+        self._back=self._blank_buffer()
+
     def _color_to_colornum(self,c):
         if type(c)==int:
             # Direct color constant used by curses.
@@ -273,51 +437,137 @@ class CurseYou(CYView):
             attrs=(),
             style=None):
 
-        # Erase if first write of the frame.
+        # Start from a blank frame if first write of the frame.
         if self._firstdraw:
-            self._scr.erase()
-            curses.update_lines_cols()
+            self._begin_frame()
             self._firstdraw=False
 
         # Bounds checking
-        xmax=curses.COLS-1
-        ymax=curses.LINES-1
-        if x<0 or (x+len(s))>xmax or y<0 or y>ymax:
-            raise TextOutOfBounds(F"Text {repr(s)} at ({x},{y}) out of bounds ({xmax},{ymax})")
+        self._check_screen_bounds(x,y,len(s),1,s)
         if "\n" in s:
             raise InvalidTextError(F"{repr(s)} contains newlines.")
 
         # Styles computation
         if style is not None:
-            fg=style.fg
-            bg=style.bg
-            attrs=style.attrs
+            attr_bitfield=self._style_attr(style)
+        else:
+            key=(_color_key(fg),_color_key(bg),frozenset(attrs))
+            attr_bitfield=self._attr_cache.get(key)
+            if attr_bitfield is None:
+                attr_bitfield=self._compile_attr(key)
+
+        # Write to the back buffer. Reaches the screen on commit().
+        self._put(x,y,s,attr_bitfield)
+
+    def _check_screen_bounds(self,x,y,w,h,what):
+        xmax=curses.COLS-1
+        ymax=curses.LINES-1
+        if x<0 or (x+w)>xmax or y<0 or (y+h-1)>ymax:
+            raise TextOutOfBounds(F"Text {repr(what)} at ({x},{y}) out of bounds ({xmax},{ymax})")
 
+    def _put(self,x,y,s,attr_bitfield):
+        self._back[y][x:x+len(s)]=[(ch,attr_bitfield) for ch in s]
+
+    def register_styles(self,styles):
+        '''
+        Compile the given styles up front, allocating their color pairs now
+        rather than on first use.
+        '''
+        for style in styles:
+            self._style_attr(style)
+
+    def _style_attr(self,style):
+        if style is None:
+            style=_DEFAULT_STYLE
+        key=style.key()
+        attr_bitfield=self._attr_cache.get(key)
+        if attr_bitfield is None:
+            attr_bitfield=self._compile_attr(key)
+        return attr_bitfield
+
+    def _compile_attr(self,key):
+        fg,bg,attrs=key
+        attr_bitfield=self._attr_bitfield(fg,bg,attrs)
+        self._attr_cache[key]=attr_bitfield
+        return attr_bitfield
+
+    def _attr_bitfield(self,fg,bg,attrs):
         fg_colornum=self._color_to_colornum(fg)
         bg_colornum=self._color_to_colornum(bg)
 
         # Initialize color pair if new
         colorpair=(fg_colornum,bg_colornum)
         if colorpair not in self._colorpairs:
-            curses.init_pair(self._colorpair_next_index, *colorpair)
-            self._colorpairs[colorpair]=self._colorpair_next_index
-            self._colorpair_next_index+=1
+            if self._colorpair_next_index>=curses.COLOR_PAIRS:
+                # Out of color pairs - fall back to the default colors
+                # rather than failing, so the table stays bounded.
+                self._colorpairs[colorpair]=0
+            else:
+                curses.init_pair(self._colorpair_next_index, *colorpair)
+                self._colorpairs[colorpair]=self._colorpair_next_index
+                self._colorpair_next_index+=1
 
         # Add the attributes to the color pair
         attr_bitfield=curses.color_pair(self._colorpairs[colorpair])
         for attr in attrs:
             attr_bitfield=attr_bitfield | attr
+        return attr_bitfield
 
-        # Actually write
-        self._scr.addstr(y,x,s,attr_bitfield)
+    def _blit_rows(self,x,y,rows,what):
+        if self._firstdraw:
+            self._begin_frame()
+            self._firstdraw=False
+
+        # rows hold (x offset, text, style) runs: width is in cells, not runs.
+        width=max((dx+len(text) for r in rows for dx,text,_ in r),default=0)
+        self._check_screen_bounds(x,y,width,len(rows),what)
+
+        for dy in range(len(rows)):
+            for dx,text,style in rows[dy]:
+                self._put(x+dx,y+dy,text,self._style_attr(style))
 
     def commit(self):
         '''
         Commit all the changes to the screen.
+        Only the cells that differ from the last commit are written,
+        with each run of adjacent changed cells sharing an attribute
+        sent as a single string.
         '''
-        self._scr.refresh()
+        scr=self._scr
+        front=self._front
+        back=self._back
+        if back is not front:
+            for y in range(self._lines):
+                brow=back[y]
+                frow=front[y]
+                if brow==frow:
+                    continue
+                x=0
+                xmax=len(brow)
+                while x<xmax:
+                    if brow[x]==frow[x]:
+                        x+=1
+                        continue
+                    attr=brow[x][1]
+                    start=x
+                    while x<xmax and brow[x]!=frow[x] and brow[x][1]==attr:
+                        x+=1
+                    scr.addstr(y,start,"".join([c[0] for c in brow[start:x]]),attr)
+            self._front=back
+        scr.refresh()
         self._firstdraw=True
 
+    def wait_for_input(self,timeout=None):
+        '''
+        Block until a key is available to getkey(), or until timeout seconds pass.
+        timeout=None waits forever.
+        Returns True if input is available.
+        '''
+        if timeout is not None and timeout<0:
+            timeout=0
+        readable,_,_=select.select([sys.stdin],[],[],timeout)
+        return bool(readable)
+
     def getkey(self):
         '''
         Get all the key presses that happened after the last call to this function.
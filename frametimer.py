@@ -0,0 +1,207 @@
+import collections
+import json
+import math
+import time
+
+'''
+Lightweight timing instrumentation for the UI loop and the engine.
+
+Durations go into RollingHistograms, one per named phase, covering the
+last few hundred samples. Optionally, every timed phase is also kept as
+an event in a bounded buffer, and can be written out as a Chrome trace
+(open it in chrome://tracing or https://ui.perfetto.dev).
+
+Usage example:
+
+timer=FrameTimer()
+tg=TetrisGame(timer=timer)  # times the engine's internal steps
+with timer.phase("draw"):
+    draw_frame(...)
+print("\\n".join(timer.format_summary()))
+timer.dump_json("metrics.json")
+'''
+
+# Histogram buckets: BUCKETS_PER_OCTAVE per doubling, starting at MIN_TIME seconds.
+# The last bucket takes everything above MIN_TIME*2**OCTAVES (about 16s).
+MIN_TIME=1e-6
+OCTAVES=24
+BUCKETS_PER_OCTAVE=4
+NUM_BUCKETS=OCTAVES*BUCKETS_PER_OCTAVE+2
+
+
+def _bucket(dt):
+    if dt<=MIN_TIME:
+        return 0
+    return min(NUM_BUCKETS-1,int(math.log2(dt/MIN_TIME)*BUCKETS_PER_OCTAVE)+1)
+
+def _format_ms(dt):
+    # Milliseconds in at most 6 characters.
+    ms=dt*1000
+    if ms<10:
+        return F"{ms:6.2f}"
+    elif ms<1000:
+        return F"{ms:6.1f}"
+    return F"{ms:6.0f}"
+
+def _bucket_value(i):
+    # Geometric middle of the bucket.
+    if i==0:
+        return MIN_TIME
+    return MIN_TIME*2**((i-0.5)/BUCKETS_PER_OCTAVE)
+
+
+class RollingHistogram():
+    '''
+    Log-bucketed histogram of the last window samples.
+    record() is O(1). Percentiles are accurate to within a bucket (about 19%).
+    '''
+    def __init__(self,window=600):
+        self._counts=[0]*NUM_BUCKETS
+        self._ring=[None]*window # (value, bucket) of the last window samples
+        self._pos=0
+        self._n=0
+        self._sum=0.0
+        self.total_count=0
+
+    def record(self,dt):
+        b=_bucket(dt)
+        old=self._ring[self._pos]
+        if old is None:
+            self._n+=1
+        else:
+            self._counts[old[1]]-=1
+            self._sum-=old[0]
+        self._ring[self._pos]=(dt,b)
+        self._counts[b]+=1
+        self._sum+=dt
+        self._pos=(self._pos+1)%len(self._ring)
+        self.total_count+=1
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def mean(self):
+        if not self._n:
+            return None
+        return self._sum/self._n
+
+    @property
+    def last(self):
+        if not self._n:
+            return None
+        return self._ring[self._pos-1][0]
+
+    @property
+    def max(self):
+        if not self._n:
+            return None
+        return max((s[0] for s in self._ring if s is not None))
+
+    def percentile(self,p):
+        '''
+        Approximate p-th percentile (0-100) of the samples in the window, in seconds.
+        '''
+        if not self._n:
+            return None
+        rank=max(1,math.ceil(self._n*p/100))
+        seen=0
+        for i,count in enumerate(self._counts):
+            seen+=count
+            if seen>=rank:
+                return _bucket_value(i)
+        return _bucket_value(NUM_BUCKETS-1)
+
+    def summary(self):
+        if not self._n:
+            return {"count":0}
+        return {"count":self._n,"total_count":self.total_count,
+                "mean":self.mean,"p50":self.percentile(50),
+                "p90":self.percentile(90),"p99":self.percentile(99),"max":self.max}
+
+
+class _Phase():
+    __slots__=("_timer","_name","_start")
+    def __init__(self,timer,name):
+        self._timer=timer
+        self._name=name
+        self._start=None
+
+    def __enter__(self):
+        self._start=time.perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        self._timer.record(self._name,self._start,time.perf_counter())
+        return False
+
+
+class FrameTimer():
+    '''
+    Named RollingHistograms of phase durations, in seconds.
+    If trace_events is nonzero, the last trace_events timed phases
+    are also kept for dump_chrome_trace().
+
+    phase(name) objects are reused, so a phase must not be nested in itself.
+    '''
+    def __init__(self,window=600,trace_events=0):
+        self._window=window
+        self.histograms={}
+        self._phases={}
+        self._origin=time.perf_counter()
+        self._trace=collections.deque(maxlen=trace_events) if trace_events else None
+
+    def phase(self,name):
+        '''
+        Context manager that times its body as the phase name.
+        '''
+        try:
+            return self._phases[name]
+        except KeyError:
+            self._phases[name]=_Phase(self,name)
+            return self._phases[name]
+
+    def record(self,name,start,end):
+        '''
+        Record a phase that ran from start to end (time.perf_counter() values).
+        '''
+        try:
+            hist=self.histograms[name]
+        except KeyError:
+            hist=self.histograms[name]=RollingHistogram(self._window)
+        hist.record(end-start)
+        if self._trace is not None:
+            self._trace.append((name,start,end))
+
+    def summary(self):
+        return {name:hist.summary() for name,hist in sorted(self.histograms.items())}
+
+    def format_summary(self):
+        '''
+        One line per phase: last, p50 and p99 in milliseconds.
+        '''
+        lines=[F"{'phase':15}{'last':>6}{'p50':>6}{'p99':>6}"]
+        for name,hist in sorted(self.histograms.items()):
+            if not len(hist):
+                continue
+            lines.append(F"{name[:14]:15}"+"".join((_format_ms(v) for v in (hist.last,hist.percentile(50),hist.percentile(99)))))
+        return lines
+
+    def dump_json(self,path):
+        '''
+        Write summary() to path, in seconds.
+        '''
+        with open(path,"w") as f:
+            json.dump({"time":time.time(),"phases":self.summary()},f,indent=2)
+
+    def dump_chrome_trace(self,path):
+        '''
+        Write the buffered phase events to path in Chrome's trace event format.
+        '''
+        if self._trace is None:
+            raise RuntimeError("FrameTimer was created without trace_events")
+        events=[{"name":name,"ph":"X","pid":1,"tid":1,
+                 "ts":(start-self._origin)*1e6,"dur":(end-start)*1e6}
+                for name,start,end in self._trace]
+        with open(path,"w") as f:
+            json.dump({"traceEvents":events,"displayTimeUnit":"ms"},f)
@@ -0,0 +1,236 @@
+import struct
+import sys
+import time
+
+from tetrisengine import TetrisGame, Key
+
+'''
+Compact binary input logs for TetrisGame, and a headless replayer.
+
+Log format:
+    header  - MAGIC, seed, start time as a little-endian double
+    seed    - one type byte, then for SEED_INT a zigzag varint, or for
+              SEED_STR (UTF-8) and SEED_BYTES a varint length and the bytes
+    events  - time delta in ticks (1/TICKS_PER_SECOND s) as a varint,
+              followed by one byte: UPDATE, END, or a Key enum value
+    END     - followed by the 8 byte BitboardMatrix.digest() of the final matrix
+
+The recorder rounds every timestamp to a whole tick before the game sees it,
+so replaying the log feeds the game bit-identical times.
+Only key() and update() are recorded - games must use the default settings.
+
+Usage example:
+
+rec=InputRecorder()
+tg=TetrisGame(time.time(),recorder=rec)
+... play ...
+log=rec.finish(tg)
+
+result=replay(log)
+assert result.ok
+'''
+
+MAGIC=b"PTRL\x02"
+TICKS_PER_SECOND=1000000
+
+UPDATE=0
+END=255
+
+SEED_INT=0
+SEED_STR=1
+SEED_BYTES=2
+
+
+class InvalidLogError(Exception):
+    pass
+
+
+def _write_varint(buf,n):
+    if n<0:
+        raise ValueError("varint must not be negative: "+str(n))
+    while n>=0x80:
+        buf.append((n&0x7f)|0x80)
+        n>>=7
+    buf.append(n)
+
+def _read_varint(data,pos):
+    res=0
+    shift=0
+    while True:
+        if pos>=len(data):
+            raise InvalidLogError("Truncated varint")
+        b=data[pos]
+        pos+=1
+        res|=(b&0x7f)<<shift
+        if not b&0x80:
+            return res,pos
+        shift+=7
+
+def _write_seed(buf,seed):
+    if isinstance(seed,int):
+        buf.append(SEED_INT)
+        _write_varint(buf,seed*2 if seed>=0 else -seed*2-1)
+    elif isinstance(seed,(str,bytes,bytearray)):
+        if isinstance(seed,str):
+            buf.append(SEED_STR)
+            seed=seed.encode("utf-8")
+        else:
+            buf.append(SEED_BYTES)
+        _write_varint(buf,len(seed))
+        buf+=seed
+    else:
+        raise TypeError(F"Cannot record a seed of type {type(seed).__name__}: use an int, str or bytes")
+
+def _read_seed(data,pos):
+    if pos>=len(data):
+        raise InvalidLogError("Truncated seed")
+    kind=data[pos]
+    n,pos=_read_varint(data,pos+1)
+    if kind==SEED_INT:
+        return (n>>1)^-(n&1),pos
+    if kind not in (SEED_STR,SEED_BYTES):
+        raise InvalidLogError("Unknown seed type "+str(kind))
+    if pos+n>len(data):
+        raise InvalidLogError("Truncated seed")
+    seed=data[pos:pos+n]
+    if kind==SEED_STR:
+        try:
+            seed=seed.decode("utf-8")
+        except UnicodeDecodeError:
+            raise InvalidLogError("Seed is not valid UTF-8")
+    return seed,pos+n
+
+
+class InputRecorder():
+    '''
+    Records every key() and update() of a TetrisGame.
+    Pass an instance to TetrisGame(recorder=...), then call finish() at the end.
+    '''
+    def __init__(self):
+        self._buf=bytearray()
+        self._t0=None
+        self._ticks=0
+        self._finished=False
+
+    def start(self,t0,seed):
+        if self._t0 is not None:
+            raise RuntimeError("InputRecorder already started")
+        header=bytearray(MAGIC)
+        _write_seed(header,seed)
+        header+=struct.pack("<d",t0)
+        self._t0=t0
+        self._buf+=header
+
+    def _record(self,t,code):
+        if self._finished:
+            raise RuntimeError("InputRecorder already finished")
+        ticks=round((t-self._t0)*TICKS_PER_SECOND)
+        if ticks<self._ticks: # clock went backwards
+            ticks=self._ticks
+        _write_varint(self._buf,ticks-self._ticks)
+        self._buf.append(code)
+        self._ticks=ticks
+        return self._t0+ticks/TICKS_PER_SECOND
+
+    def record_update(self,t):
+        '''
+        Record an update() at time t. Returns t rounded to a whole tick.
+        '''
+        return self._record(t,UPDATE)
+
+    def record_key(self,t,ktype):
+        '''
+        Record a key() at time t. Returns t rounded to a whole tick.
+        '''
+        return self._record(t,ktype.value)
+
+    def finish(self,tg):
+        '''
+        End the log with the digest of tg's final matrix, and return it.
+        '''
+        _write_varint(self._buf,0)
+        self._buf.append(END)
+        self._buf+=bytes.fromhex(tg.pf.get_bitboard().digest())
+        self._finished=True
+        return bytes(self._buf)
+
+    def getvalue(self):
+        return bytes(self._buf)
+
+
+class ReplayResult():
+    def __init__(self,game,expected_digest,events):
+        self.game=game
+        self.expected_digest=expected_digest
+        self.digest=game.pf.get_bitboard().digest()
+        self.events=events
+
+    @property
+    def ok(self):
+        '''
+        True if the log was complete and the final matrix matched.
+        '''
+        return self.expected_digest is not None and self.expected_digest==self.digest
+
+
+def replay(log):
+    '''
+    Re-run an input log headlessly, as fast as the engine allows.
+    Returns a ReplayResult.
+    '''
+    log=bytes(log)
+    if not log.startswith(MAGIC):
+        raise InvalidLogError("Not an input log")
+    pos=len(MAGIC)
+    seed,pos=_read_seed(log,pos)
+    if pos+8>len(log):
+        raise InvalidLogError("Truncated header")
+    t0,=struct.unpack_from("<d",log,pos)
+    pos+=8
+
+    tg=TetrisGame(t0,seed=seed)
+    keys={k.value:k for k in Key}
+    ticks=0
+    events=0
+    expected_digest=None
+    while pos<len(log):
+        delta,pos=_read_varint(log,pos)
+        if pos>=len(log):
+            raise InvalidLogError("Truncated event")
+        code=log[pos]
+        pos+=1
+        ticks+=delta
+        t=t0+ticks/TICKS_PER_SECOND
+        if code==UPDATE:
+            tg.update(t)
+        elif code==END:
+            if pos+8>len(log):
+                raise InvalidLogError("Truncated digest")
+            expected_digest=log[pos:pos+8].hex()
+            break
+        elif code in keys:
+            tg.key(t,keys[code])
+        else:
+            raise InvalidLogError("Unknown event code "+str(code))
+        events+=1
+    return ReplayResult(tg,expected_digest,events)
+
+
+def main(paths):
+    failed=0
+    start=time.perf_counter()
+    events=0
+    for path in paths:
+        with open(path,"rb") as f:
+            result=replay(f.read())
+        events+=result.events
+        if not result.ok:
+            failed+=1
+            print(F"MISMATCH {path}: expected {result.expected_digest}, got {result.digest}")
+    elapsed=time.perf_counter()-start
+    print(F"{len(paths)} logs, {events} events, {failed} failed, {elapsed:.3f}s")
+    return 1 if failed else 0
+
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
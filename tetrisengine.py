@@ -0,0 +1,2079 @@
+import random
+import enum
+import copy
+import math
+import heapq
+import collections
+import itertools
+import hashlib
+import contextlib
+
+'''
+Headless Tetris engine.
+Has no dependency on curses, so it can be imported and driven
+from scripts, bots and batch jobs. The curses front-end lives in pytris.py.
+
+Usage example:
+
+tg=TetrisGame()
+for i in range(100):
+    tg.step((Key.ROTATE_RIGHT,Key.DROP_HARD),dt=1/60)
+'''
+
+# Helper functions for dealing with tuples as vectors.
+class Tuples:
+    @classmethod
+    def sub(cls,a,b):
+        return cls.add(a,cls.neg(b))
+    @classmethod
+    def add(cls,a,b):
+        return cls.forelem2(a,b,lambda x,y:x+y)
+    @classmethod
+    def neg(cls,a):
+        return cls.forelem(a,lambda x:-x)
+    @classmethod
+    def mag(cls,a):
+        return math.sqrt(sum([i*i for i in a]))
+    @classmethod
+    def forelem(cls,a,f):
+        return tuple((f(i) for i in a))
+    @classmethod
+    def forelem2(cls,a,b,f):
+        if len(a)!=len(b):
+            raise Exception("Mismatched tuple length")
+        return tuple((f(a[i],b[i]) for i in range(len(a))))
+
+
+class Block():
+    '''
+    Class representing a single block in the matrix.
+    Immutable, and interned: Block() with the same arguments
+    always returns the same instance, so blocks can be compared with "is".
+    '''
+    __slots__=("_solid","_source","_spook")
+    _interned={}
+
+    def __new__(cls,solid=True,source="X",ghost=False):
+        key=(solid,source,ghost)
+        try:
+            return cls._interned[key]
+        except KeyError:
+            self=super().__new__(cls)
+            object.__setattr__(self,"_solid",solid)
+            object.__setattr__(self,"_source",source)
+            object.__setattr__(self,"_spook",ghost)
+            cls._interned[key]=self
+            return self
+
+    def __setattr__(self,name,value):
+        raise ImmutableModificationException
+    def __reduce__(self):
+        return (Block,(self._solid,self._source,self._spook))
+    def __copy__(self):
+        return self
+    def __deepcopy__(self,memo):
+        return self
+
+    @property
+    def solid(self):
+        return self._solid
+    @property
+    def source(self):
+        return self._source
+    @property
+    def ghost(self):
+        return self._spook
+
+    def ghostify(self):
+        try:
+            return Block._interned[(self._solid,self._source,True)]
+        except KeyError:
+            return Block(self._solid,self._source,True)
+
+    def __repr__(self):
+        return F"Block(solid={self.solid},source={self.source})"
+
+# Canonical blocks
+EMPTY_BLOCK=Block(solid=False)
+SOLID_BLOCK=Block()
+OOB_BLOCK=SOLID_BLOCK # What is outside the matrix
+
+
+class RasterOutOfBoundsException(Exception):
+    pass
+
+class ImmutableModificationException(Exception):
+    pass
+
+class Pixel2DSet():
+    '''
+    Class represneting a set of blocks. Immutable.
+    Note that unlike Raster2D this does nont need to be a square.
+    '''
+    def __init__(self):
+        self._pixels=dict()
+    def __iter__(self):
+        return self._pixels.__iter__()
+    def __getitem__(self,k):
+        return self._pixels[k]
+    def translate(self,x,y):
+        res = Pixel2DSet()
+        for coords in self:
+            oc=coords
+            nc=(oc[0]+x,oc[1]+y)
+            res._pixels[nc]=self._pixels[oc]
+        return res
+    
+    def get_boundingbox(self):
+        xmin=+1000
+        xmax=-1000
+        ymin=+1000
+        ymax=-1000
+        for x,y in self:
+            xmin=min(xmin,x)
+            xmax=max(xmax,x)
+            ymin=min(ymin,y)
+            ymax=max(ymax,y)
+        return {
+            "X-":xmin,
+            "X+":xmax,
+            "Y-":ymin,
+            "Y+":ymax}
+    def make_ghost(self):
+        res = Pixel2DSet()
+        for coords in self:
+            res._pixels[coords]=self._pixels[coords].ghostify()
+        return res
+
+    @classmethod
+    def from_dict(cls,d):
+        dat=copy.copy(d)
+        res=Pixel2DSet()
+        res._pixels=dat
+        return res
+
+    @classmethod
+    def from_r2d(cls,r2d):
+        res=Pixel2DSet()
+        
+        for coords in r2d:
+            res._pixels[coords]=r2d[coords]
+        return res
+    
+    @classmethod
+    def from_string(cls,*args,fill=SOLID_BLOCK):
+        '''
+        #=filled, @=center, !=center unfilled
+        '''
+
+        s="\n".join(args)
+
+        res=Pixel2DSet()
+
+        center_coords=(0,0)
+        ss=s.split("\n")
+
+        lineN=len(ss)
+        for lineI in range(len(ss)):
+            lineS=ss[lineI]
+            for colI in range(len(lineS)):
+                ch=lineS[colI]
+                co=(colI,lineN-lineI-1)
+
+                if ch=="#" or ch=="@":
+                    res._pixels[co]=fill
+                    
+                if ch=="@" or ch=="!":
+                    center_coords=co
+                
+                
+                
+        res=res.translate(*Tuples.neg(center_coords))
+        
+        return res
+
+    def __str__(self):
+        return "Pixel2DSet with pixels:\n"+"\n".join(("  "+str(self[i]) for i in self))
+
+
+    
+
+class Raster2D():
+    '''
+    Represents a rectangular grid of blocks. Immutable.
+    Must receive the X,Y dimensions with a list/tuple with the exact size 
+    '''
+    def __init__(self,x,y,data):
+        self._x=x
+        self._y=y
+        self._dataN=x*y
+
+        self._data=tuple(data)
+        
+        if len(self._data)!=self._dataN:
+            raise ValueError
+
+
+    @property
+    def x(self):
+        return self._x
+    @property
+    def y(self):
+        return self._y
+
+    def __iter__(self):
+
+        for y in range(self._y):
+            for x in range(self._x):
+                yield (x,y)
+
+
+    def _coord_to_idx(self,x,y):
+        if x<0 or x>=self._x or y<0 or y>=self._y:
+            raise RasterOutOfBoundsException("converted",x,y,"in a Raster2D of dimension",self._x,self._y)
+        return x+y*self._x
+
+    def composite_p2ds(self,p2ds):
+        newdata=list(self._data)
+        for coords in p2ds:
+            newdata[self._coord_to_idx(*coords)]=p2ds[coords]
+
+        return Raster2D(self._x,self._y,newdata)
+
+
+
+    def crop(self,bbox):
+        # coordinates are inclusive
+        x_min,y_min,x_max,y_max=bbox
+        
+        x_size=x_max-x_min+1
+        y_size=y_max-y_min+1
+
+        cropdata=[]
+        for y in range(y_min,y_max+1):
+            for x in range(x_min,x_max+1):
+                cropdata.append(self[(x,y)])
+
+        return Raster2D(x_size,y_size,cropdata)
+            
+        
+    
+    def __getitem__(self,c):
+        idx=self._coord_to_idx(c[0],c[1])
+        return self._data[idx]
+    def __setitem__(self,c,val):
+        raise ImmutableModificationException
+
+    @classmethod
+    def blank_fill(cls,x,y,blank):
+        return Raster2D(x,y,(blank,)*(x*y))
+
+
+
+class OOBFilledRaster2D(Raster2D):
+    def __init__(self,r2d,oob=OOB_BLOCK):
+        self._r2d=r2d
+        self._oob=oob
+    def __getitem__(self,c):
+        try:
+            return self._r2d[c]
+        except RasterOutOfBoundsException:
+            return self._oob
+
+
+# Block.source <-> small integer id, for the color layer of BitboardMatrix.
+# id 0 is reserved for empty cells.
+_source_ids={}
+_source_names=[None]
+_source_blocks=[EMPTY_BLOCK]
+def _source_to_id(source):
+    try:
+        return _source_ids[source]
+    except KeyError:
+        if len(_source_names)>255:
+            raise ValueError("Too many distinct block sources")
+        _source_ids[source]=len(_source_names)
+        _source_names.append(source)
+        _source_blocks.append(Block(source=source))
+        return _source_ids[source]
+
+class ZobristTable():
+    '''
+    Random 64-bit keys for Zobrist hashing of matrix states.
+    Keys are generated deterministically from the matrix dimensions,
+    so hashes are stable between runs and processes.
+    Use ZobristTable.get() rather than creating new ones.
+    '''
+    _tables={}
+
+    def __init__(self,x,y):
+        rng=random.Random(F"pytris-zobrist-{x}x{y}")
+        self.cells=tuple((tuple((rng.getrandbits(64) for i in range(x))) for j in range(y)))
+
+        # Per row, per 8 column chunk: XOR of the cell keys for each of the 256 bit patterns.
+        # Lets row_hash() hash a whole row with one lookup per 8 columns.
+        chunks=[]
+        for j in range(y):
+            row_chunks=[]
+            for base in range(0,x,8):
+                keys=self.cells[j][base:base+8]
+                table=[0]*256
+                for pattern in range(1,256):
+                    low=pattern&-pattern
+                    i=low.bit_length()-1
+                    table[pattern]=table[pattern^low]^(keys[i] if i<len(keys) else 0)
+                row_chunks.append(tuple(table))
+            chunks.append(tuple(row_chunks))
+        self._chunks=tuple(chunks)
+        self._extra_keys={}
+
+    @classmethod
+    def get(cls,x,y):
+        if (x,y) not in cls._tables:
+            cls._tables[(x,y)]=ZobristTable(x,y)
+        return cls._tables[(x,y)]
+
+    def row_hash(self,y,row):
+        h=0
+        for table in self._chunks[y]:
+            h^=table[row&0xff]
+            row>>=8
+        return h
+
+    def hash_rows(self,rows):
+        h=0
+        for y in range(len(rows)):
+            if rows[y]:
+                h^=self.row_hash(y,rows[y])
+        return h
+
+    def key(self,*parts):
+        '''
+        Stable 64-bit key for anything outside the matrix,
+        e.g. key("hold","SRS_T"). parts must have a stable repr().
+        '''
+        try:
+            return self._extra_keys[parts]
+        except KeyError:
+            digest=hashlib.blake2b(repr(parts).encode(),digest_size=8).digest()
+            self._extra_keys[parts]=int.from_bytes(digest,"little")
+            return self._extra_keys[parts]
+
+
+class BitboardMatrix():
+    '''
+    Matrix of locked blocks, stored as one int per row.
+    Bit x of row y is set if the cell (x,y) is filled.
+    Block.source of each filled cell is kept in a separate
+    bytearray color layer, indexed the same way as Raster2D.
+    Mutable.
+
+    Cells outside the matrix are treated as filled, like OOBFilledRaster2D.
+
+    A Zobrist hash of the occupancy and the height of each column are
+    kept up to date as blocks are locked and rows are cleared -
+    see zobrist_hash and heights.
+    '''
+    def __init__(self,x,y):
+        self._x=x
+        self._y=y
+        self._full_row=(1<<x)-1
+        self._rows=[0]*y
+        self._colors=bytearray(x*y)
+        self._heights=[0]*x
+        self._shared=False
+        self._zobrist=ZobristTable.get(x,y)
+        self._hash=0
+
+    @property
+    def x(self):
+        return self._x
+    @property
+    def y(self):
+        return self._y
+    @property
+    def rows(self):
+        return tuple(self._rows)
+    @property
+    def zobrist_hash(self):
+        '''
+        64-bit Zobrist hash of which cells are filled.
+        Block sources are not included.
+        '''
+        return self._hash
+    @property
+    def zobrist_table(self):
+        return self._zobrist
+    @property
+    def heights(self):
+        '''
+        Tuple of column heights: 1 + the highest filled y of each column, 0 if empty.
+        '''
+        return tuple(self._heights)
+
+    def snapshot(self):
+        '''
+        Return a copy-on-write copy of this matrix.
+        Storage is shared until either copy is modified,
+        so taking a snapshot costs the same regardless of the matrix size.
+        '''
+        res=copy.copy(self)
+        self._shared=True
+        res._shared=True
+        return res
+
+    def _unshare(self):
+        if self._shared:
+            self._rows=list(self._rows)
+            self._colors=bytearray(self._colors)
+            self._heights=list(self._heights)
+            self._shared=False
+
+    def _update_heights(self):
+        # Scan down from the top until every column has been found.
+        heights=[0]*self._x
+        remaining=self._full_row
+        for y in range(self._y-1,-1,-1):
+            found=self._rows[y]&remaining
+            while found:
+                low=found&-found
+                heights[low.bit_length()-1]=y+1
+                found^=low
+            remaining&=~self._rows[y]
+            if not remaining:
+                break
+        self._heights=heights
+
+    def block_at(self,x,y):
+        # The color layer is 0 (the empty block) for every unfilled cell.
+        return _source_blocks[self._colors[x+y*self._x]]
+
+    def is_filled(self,x,y):
+        if x<0 or x>=self._x or y<0 or y>=self._y:
+            return True
+        return (self._rows[y]>>x)&1==1
+
+    def overlap(self,p2ds):
+        rows=self._rows
+        for x,y in p2ds:
+            if x<0 or x>=self._x or y<0 or y>=self._y:
+                return True
+            if (rows[y]>>x)&1:
+                return True
+        return False
+
+    def lock(self,p2ds):
+        '''
+        Fill the cells of p2ds, recording the source of each block.
+        Returns the sorted tuple of rows that were touched.
+        '''
+        self._unshare()
+        touched=set()
+        for coords in p2ds:
+            x,y=coords
+            if x<0 or x>=self._x or y<0 or y>=self._y:
+                raise RasterOutOfBoundsException("locked",x,y,"in a matrix of dimension",self._x,self._y)
+            if not (self._rows[y]>>x)&1:
+                self._rows[y]|=1<<x
+                self._hash^=self._zobrist.cells[y][x]
+                if self._heights[x]<=y:
+                    self._heights[x]=y+1
+            self._colors[x+y*self._x]=_source_to_id(p2ds[coords].source)
+            touched.add(y)
+        return tuple(sorted(touched))
+
+    def fits(self,cshape,x,y):
+        '''
+        Return True if the CompiledShape cshape, placed at (x,y),
+        is inside the matrix and does not overlap any filled cell.
+        '''
+        sx=x+cshape.xmin
+        if sx<0 or x+cshape.xmax>=self._x or y+cshape.ymin<0 or y+cshape.ymax>=self._y:
+            return False
+        rows=self._rows
+        for dy,mask in cshape.row_masks:
+            if rows[y+dy]&(mask<<sx):
+                return False
+        return True
+
+    def corner_bits(self,x,y):
+        '''
+        The four cells diagonal to (x,y), as a 4 bit mask:
+        1=(x-1,y-1) 2=(x+1,y-1) 4=(x-1,y+1) 8=(x+1,y+1).
+        '''
+        res=0
+        walls=1|(1<<(self._x+1))
+        for shift,yy in ((0,y-1),(2,y+1)):
+            if 0<=yy<self._y:
+                # Pad the row with a filled cell on each side, so walls count.
+                row=(((self._rows[yy]<<1)|walls)>>x)&0b101
+            else:
+                row=0b101
+            res|=((row&1)|(row>>1))<<shift
+        return res
+
+    def drop_distance(self,cshape,x,y):
+        '''
+        How many rows cshape, placed at (x,y) where it fits, can fall before landing.
+        Constant time from the column heights, unless part of the shape
+        is below the surface (e.g. under an overhang) - then each row is tested.
+        '''
+        heights=self._heights
+        dist=self._y
+        for dx,dy in cshape.col_bottoms:
+            d=y+dy-heights[x+dx]
+            if d<dist:
+                dist=d
+        if dist>=0:
+            return dist
+        dist=0
+        while self.fits(cshape,x,y-dist-1):
+            dist+=1
+        return dist
+
+    def full_rows(self,rows=None):
+        '''
+        Return the full rows, in ascending order.
+        If rows is given, only those rows are checked.
+        '''
+        full=self._full_row
+        if rows is None:
+            rows=range(self._y)
+        return tuple((y for y in rows if self._rows[y]==full))
+
+    def clear_row(self,y):
+        '''
+        Remove row y, shifting everything above it down by one.
+        '''
+        self._unshare()
+        del self._rows[y]
+        self._rows.append(0)
+        del self._colors[y*self._x:(y+1)*self._x]
+        self._colors.extend(bytes(self._x))
+        self._hash=self._zobrist.hash_rows(self._rows)
+        self._update_heights()
+
+    def clear_rows(self,ys):
+        '''
+        Remove all the rows in ys in a single compaction pass,
+        shifting the remaining rows down.
+        '''
+        if not ys:
+            return
+        ys=set(ys)
+        X=self._x
+        rows=[]
+        colors=bytearray()
+        for y in range(self._y):
+            if y not in ys:
+                rows.append(self._rows[y])
+                colors+=self._colors[y*X:(y+1)*X]
+        cleared=self._y-len(rows)
+        rows.extend((0,)*cleared)
+        colors.extend(bytes(X*cleared))
+        self._rows=rows
+        self._colors=colors
+        self._shared=False
+        self._hash=self._zobrist.hash_rows(rows)
+        self._update_heights()
+
+    def digest(self):
+        '''
+        Short hex digest of the locked blocks, including their sources.
+        '''
+        h=hashlib.blake2b(digest_size=8)
+        h.update(F"{self._x}x{self._y}:".encode())
+        for row in self._rows:
+            h.update(row.to_bytes((self._x+7)//8,"little"))
+        h.update(self._colors)
+        return h.hexdigest()
+
+    def to_r2d(self):
+        return Raster2D(self._x,self._y,
+                        (_source_blocks[c] for c in self._colors))
+
+    @classmethod
+    def from_r2d(cls,r2d):
+        res=BitboardMatrix(r2d.x,r2d.y)
+        for x,y in r2d:
+            block=r2d[x,y]
+            if block.solid:
+                res._rows[y]|=1<<x
+                res._colors[x+y*res._x]=_source_to_id(block.source)
+        res._hash=res._zobrist.hash_rows(res._rows)
+        res._update_heights()
+        return res
+
+
+class MatrixView(Raster2D):
+    '''
+    Read-only Raster2D view of a BitboardMatrix snapshot,
+    with an optional overlay of blocks (e.g. the active mino and its ghost)
+    drawn over it.
+    Blocks are looked up on access, so no cell tuple is ever built.
+    Immutable.
+    '''
+    def __init__(self,matrix,overlay=None):
+        self._x=matrix.x
+        self._y=matrix.y
+        self._dataN=self._x*self._y
+        self._matrix=matrix
+        self._overlay=overlay if overlay is not None else dict()
+
+    def __getitem__(self,c):
+        x,y=c
+        if x<0 or x>=self._x or y<0 or y>=self._y:
+            raise RasterOutOfBoundsException("accessed",x,y,"in a MatrixView of dimension",self._x,self._y)
+        if self._overlay:
+            b=self._overlay.get((x,y))
+            if b is not None:
+                return b
+        return self._matrix.block_at(x,y)
+
+    def composite_p2ds(self,p2ds):
+        overlay=dict(self._overlay)
+        for coords in p2ds:
+            self._coord_to_idx(*coords) # bounds check
+            overlay[coords]=p2ds[coords]
+        return MatrixView(self._matrix,overlay)
+
+
+class CompiledShape():
+    '''
+    Collision form of a Pixel2DSet, precompiled once so that
+    BitboardMatrix.fits() can test a placement without allocating.
+    Immutable.
+        .offsets = tuple of (x,y) cell offsets
+        .xmin .xmax .ymin .ymax = inclusive bounding box of the offsets
+        .row_masks = tuple of (y offset, bitmask) pairs, one per row.
+                     Bit 0 of the mask corresponds to x offset xmin.
+        .col_bottoms = tuple of (x offset, lowest y offset) pairs, one per column.
+    '''
+    __slots__=("offsets","xmin","xmax","ymin","ymax","row_masks","col_bottoms")
+    def __init__(self,p2ds):
+        self.offsets=tuple(sorted(p2ds))
+        bbx=p2ds.get_boundingbox()
+        self.xmin=bbx["X-"]
+        self.xmax=bbx["X+"]
+        self.ymin=bbx["Y-"]
+        self.ymax=bbx["Y+"]
+
+        masks={}
+        for x,y in self.offsets:
+            masks[y]=masks.get(y,0)|(1<<(x-self.xmin))
+        self.row_masks=tuple(sorted(masks.items()))
+
+        bottoms={}
+        for x,y in self.offsets:
+            bottoms[x]=min(bottoms.get(x,y),y)
+        self.col_bottoms=tuple(sorted(bottoms.items()))
+
+    @classmethod
+    def compile_rotations(cls,shapes):
+        return tuple((CompiledShape(s) for s in shapes))
+
+
+class BagRandomizer():
+    '''
+    Deals out minos one shuffled bag at a time.
+    Each instance owns its own random.Random, so sequences are independent
+    between instances and reproducible from the seed.
+    If seed is None, one is drawn from the global random module.
+    '''
+    def __init__(self, minos=(), seed=None):
+        if seed is None:
+            seed=random.getrandbits(64)
+        self._seed=seed
+        self._rng=random.Random(seed)
+        self.buffer=collections.deque()
+        self._minos=tuple(minos)
+    @property
+    def seed(self):
+        return self._seed
+    @property
+    def bag_position(self):
+        '''
+        How many minos have been dealt from the current bag.
+        '''
+        return (len(self._minos)-len(self.buffer)%len(self._minos))%len(self._minos)
+    def __iter__(self):
+        return self
+    def __next__(self):
+        return self.generate_next()
+    def peek(self,n):
+        self._expand_buffer(n)
+        return tuple(itertools.islice(self.buffer,n))
+    def take(self,n):
+        '''
+        Remove and return the next n minos.
+        '''
+        self._expand_buffer(n)
+        popleft=self.buffer.popleft
+        return tuple((popleft() for i in range(n)))
+    def _expand_buffer(self,n):
+        while len(self.buffer)<n:
+            l=list(self._minos)
+            self._rng.shuffle(l)
+            self.buffer.extend(l)
+    def generate_next(self):
+        self._expand_buffer(1)
+        return self.buffer.popleft()
+            
+class GameConstants:
+    lockdown_delay=0.5
+
+class Tetrimino():
+    def __init__(self, coords, rotation):
+        self._coords=coords
+        self._rotation=rotation
+        self._playfield=None
+
+        self._last_movement=None
+        # (dx,dy) kick of the last rotation, or None if the last movement was not a rotation
+        self._last_kick=None
+
+        self._gravity_remainder=0
+        self._dead=False
+
+        self._lc=None
+
+        # (matrix version, ghost blocks) - see get_ghost_blocks()
+        self._ghost_cache=None
+
+    def get_lineclear(self):
+        return self._lc
+
+    def link_to_playfield(self,pf):
+        self._playfield=pf
+
+    def die(self):
+        self._dead=True
+    @property
+    def dead(self):
+        return self._dead
+
+    def is_immobile(self):
+        x,y=self._coords
+        for dx,dy in ((1,0),(-1,0),(0,1),(0,-1)):
+            if self._fits(x+dx,y+dy,self._rotation):
+                return False
+        return True
+
+    def _fits(self,x,y,rotation):
+        return self._playfield.fits(type(self),x,y,rotation)
+        
+    def get_blocks(self):
+        p2ds=self.shape()
+        return p2ds.translate(*self._coords)
+    def shape(self):
+        raise NotImplementedError
+    def compiled_shape(self):
+        return self.compiled_shapes()[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        '''
+        CompiledShape for each of the 4 rotations.
+        '''
+        raise NotImplementedError
+    @classmethod
+    def front_corners(cls):
+        '''
+        For pieces that use the 3-corner spin rule: for each rotation,
+        the BitboardMatrix.corner_bits() mask of the two corners the piece points at.
+        None for every other piece.
+        '''
+        return None
+    def _translate(self,x,y):
+        self._coords=Tuples.add(self._coords,(x,y))
+        self._ghost_cache=None
+    def _kicks(self,old_rotation,new_rotation):
+        raise NotImplementedError
+
+    
+    def _rotate(self,rot,t):
+        if not(rot==1 or rot==-1 or rot==2):
+            raise Exception("Invalid rotation delta!")
+        
+        old_rotation=self._rotation
+        new_rotation=(old_rotation+rot)%4
+        
+        x,y=self._coords
+        
+        kick_tests=self._kicks(old_rotation,new_rotation)
+        for kx,ky in kick_tests:
+            if self._fits(x+kx,y+ky,new_rotation):
+                #test pass!
+                self._coords=(x+kx,y+ky)
+                self._rotation=new_rotation
+                self._ghost_cache=None
+                self._update_movement(t)
+                self._last_kick=(kx,ky)
+                break
+    
+
+    @classmethod
+    def overlap(cls,r2d,p2ds):
+        for bcoords in p2ds:
+            if r2d[bcoords].solid==True:
+                return True
+        return False
+
+    def copy(self):
+        return copy.copy(self)
+    def _try_move(self,delta_x,delta_y,t):
+        x,y=self._coords
+        if not self._fits(x+delta_x,y+delta_y,self._rotation):
+            return False
+        
+ 
+        #Can go
+        self._coords=(x+delta_x,y+delta_y)
+        self._ghost_cache=None
+        self._update_movement(t)
+        self._last_kick=None
+        return True
+    def _update_movement(self,t):
+        self._last_movement=t
+    @property
+    def coords(self):
+        return self._coords
+    @property
+    def rotation(self):
+        return self._rotation
+    @property
+    def last_movement(self):
+        '''
+        Time of the last successful move or rotation, or None.
+        '''
+        return self._last_movement
+    def time_since_last_movement(self,t):
+        if self._last_movement is None:
+            return None
+        return t-self._last_movement
+    def get_ghost_blocks(self):
+        '''
+        Ghostified blocks of where this mino would land if dropped.
+        Memoized until the mino moves or the matrix changes.
+        '''
+        version=self._playfield.matrix_version
+        if self._ghost_cache is None or self._ghost_cache[0]!=version:
+            x,y=self._coords
+            y-=self.drop_distance()
+            ghostblocks=self.shape().translate(x,y).make_ghost()
+            self._ghost_cache=(version,ghostblocks)
+        return self._ghost_cache[1]
+
+    def drop_distance(self):
+        '''
+        How many rows this mino can fall before landing.
+        '''
+        x,y=self._coords
+        return self._playfield.drop_distance(type(self),x,y,self._rotation)
+
+    def _fall(self,dist,t):
+        if dist>0:
+            x,y=self._coords
+            self._coords=(x,y-dist)
+            self._ghost_cache=None
+            self._update_movement(t)
+            self._last_kick=None
+        return dist
+
+    @property
+    def last_move_was_rotation(self):
+        return self._last_kick is not None
+
+    def spin(self):
+        '''
+        Spin type of this mino where it is now - see Playfield.classify_spin().
+        '''
+        x,y=self._coords
+        return self._playfield.classify_spin(type(self),x,y,self._rotation,self._last_kick)
+
+    def firm_drop(self,t):
+        self._fall(self.drop_distance(),t)
+    
+    def lock(self):
+        self._lc=self._playfield.lock_mino(self)
+
+    def hard_drop(self,t):
+        self.firm_drop(t)
+        self.lock()
+        
+    
+    def gravity(self,n,t):
+        '''
+        Fall n rows at once, stopping at the landing row.
+        Returns the number of rows fallen.
+        '''
+        return self._fall(min(n,self.drop_distance()),t)
+
+    def enumerate_placements(self):
+        '''
+        Every distinct place this mino can lock into from where it is now.
+        See Playfield.enumerate_placements().
+        '''
+        return self._playfield.enumerate_placements(type(self),self._coords,self._rotation)
+    
+    def input(self,t,
+              rotate_r=False,rotate_l=False,rotate_180=False,
+              hard=False,soft=False,left=False,right=False):
+        if rotate_r:
+            self._rotate(+1,t)
+        elif rotate_l:
+            self._rotate(-1,t)
+        elif rotate_180:
+            self._rotate(2,t)
+
+        if hard:
+            self.hard_drop(t)
+        elif soft:
+            self.firm_drop(t)#gravity(1)
+        elif left:
+            self._try_move(-1,0,t)
+        elif right:
+            self._try_move(+1,0,t)
+
+        
+# http://harddrop.com/wiki/SRS#How_Guideline_SRS_Really_Works
+class SRS_Tetrimino(Tetrimino):
+    _compiled_kicks=None # Set for each piece class once its kicks are compiled
+
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+    def _kicks(self, old_rotation, new_rotation):
+        return self._compiled_kicks[(old_rotation,new_rotation)]
+
+    @classmethod
+    def compiled_kicks(cls):
+        '''
+        {(old rotation, new rotation): ((dx,dy), ...)} kick translations,
+        in the order they are tested. Includes 180 degree rotations.
+        '''
+        return cls._compiled_kicks
+
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        raise NotImplementedError
+
+def _compile_SRS_kicks(kick_offsets,kicks_180):
+    # 90 degree kicks: old offset - new offset, for each row of the offset table.
+    # 180 degree kicks: the "no kick" row's offset, plus each of kicks_180[old rotation].
+    res={}
+    for old_rotation in range(4):
+        for new_rotation in range(4):
+            if old_rotation==new_rotation:
+                continue
+            if (new_rotation-old_rotation)%4==2:
+                o=kick_offsets[0][old_rotation]
+                n=kick_offsets[0][new_rotation]
+                candidates=[(o[0]-n[0]+kx,o[1]-n[1]+ky) for kx,ky in kicks_180[old_rotation]]
+            else:
+                candidates=[Tuples.sub(offsets[old_rotation],offsets[new_rotation]) for offsets in kick_offsets]
+            kicks=[]
+            for kick in candidates:
+                if kick not in kicks: # Repeats would fail the same way
+                    kicks.append(kick)
+            res[(old_rotation,new_rotation)]=tuple(kicks)
+    return res
+
+# 180 degree kicks, as in SRS+ (TETR.IO). Indexed by the rotation before the 180.
+_SRS_Kicks_180=(((0,0),(0,1),(1,1),(-1,1),(1,0),(-1,0)), # 0->2
+                ((0,0),(1,0),(1,2),(1,1),(0,2),(0,1)), # 1->3
+                ((0,0),(0,-1),(-1,-1),(1,-1),(-1,0),(1,0)), # 2->0
+                ((0,0),(-1,0),(-1,2),(-1,1),(0,2),(0,1))) # 3->1
+_SRS_Kicks_180_None=(((0,0),),)*4
+    
+_SRS_Kicks_JLSTZ=(((0,0),(0,0),(0,0),(0,0)), #No kick
+                  ((0,0),(1,0),(0,0),(-1,0)), #Kick 1
+                  ((0,0),(+1,-1),(0,0),(-1,-1)), #Kick 2
+                  ((0,0),(0,2),(0,0),(0,+2)), #Kick 3
+                  ((0,0),(1,2),(0,0),(-1,2))) #Kick 4
+_SRS_Shapes_T=[None]*4
+_SRS_Shapes_T[0]=Pixel2DSet.from_string(" # ",
+                                        "#@#",
+                                        fill=Block(source="T"))
+_SRS_Shapes_T[1]=Pixel2DSet.from_string("# ",
+                                        "@#",
+                                        "# ",
+                                        fill=Block(source="T"))
+_SRS_Shapes_T[2]=Pixel2DSet.from_string("#@#",
+                                        " # ",
+                                        fill=Block(source="T"))
+_SRS_Shapes_T[3]=Pixel2DSet.from_string(" #",
+                                        "#@",
+                                        " #",
+                                        fill=Block(source="T"))
+_SRS_Compiled_T=CompiledShape.compile_rotations(_SRS_Shapes_T)
+# Corners in front of the T's nub, as BitboardMatrix.corner_bits() masks
+_SRS_Front_Corners_T=(4|8, # pointing up
+                      2|8, # right
+                      1|2, # down
+                      1|4) # left
+
+
+_SRS_Shapes_L=[None]*4
+_SRS_Shapes_L[0]=Pixel2DSet.from_string("  #",
+                                        "#@#",
+                                        fill=Block(source="L"))
+_SRS_Shapes_L[1]=Pixel2DSet.from_string("# ",
+                                        "@ ",
+                                        "##",
+                                        fill=Block(source="L"))
+_SRS_Shapes_L[2]=Pixel2DSet.from_string("#@#",
+                                        "#  ",
+                                        fill=Block(source="L"))
+_SRS_Shapes_L[3]=Pixel2DSet.from_string("##",
+                                        " @",
+                                        " #",
+                                        fill=Block(source="L"))
+_SRS_Compiled_L=CompiledShape.compile_rotations(_SRS_Shapes_L)
+
+_SRS_Shapes_J=[None]*4
+_SRS_Shapes_J[0]=Pixel2DSet.from_string("#  ",
+                                        "#@#",
+                                        fill=Block(source="J"))
+_SRS_Shapes_J[1]=Pixel2DSet.from_string("##",
+                                        "@ ",
+                                        "# ",
+                                        fill=Block(source="J"))
+_SRS_Shapes_J[2]=Pixel2DSet.from_string("#@#",
+                                        "  #",
+                                        fill=Block(source="J"))
+_SRS_Shapes_J[3]=Pixel2DSet.from_string(" #",
+                                        " @",
+                                        "##",
+                                        fill=Block(source="J"))
+_SRS_Compiled_J=CompiledShape.compile_rotations(_SRS_Shapes_J)
+
+_SRS_Shapes_S=[None]*4
+_SRS_Shapes_S[0]=Pixel2DSet.from_string(" ##",
+                                        "#@ ",
+                                        fill=Block(source="S"))
+_SRS_Shapes_S[1]=Pixel2DSet.from_string("# ",
+                                        "@#",
+                                        " #",
+                                        fill=Block(source="S"))
+_SRS_Shapes_S[2]=Pixel2DSet.from_string(" @#",
+                                        "## ",
+                                        fill=Block(source="S"))
+_SRS_Shapes_S[3]=Pixel2DSet.from_string("# ",
+                                        "#@",
+                                        " #",
+                                        fill=Block(source="S"))
+_SRS_Compiled_S=CompiledShape.compile_rotations(_SRS_Shapes_S)
+
+_SRS_Shapes_Z=[None]*4
+_SRS_Shapes_Z[0]=Pixel2DSet.from_string("## ",
+                                        " @#",
+                                        fill=Block(source="Z"))
+_SRS_Shapes_Z[1]=Pixel2DSet.from_string(" #",
+                                        "@#",
+                                        "# ",
+                                        fill=Block(source="Z"))
+_SRS_Shapes_Z[2]=Pixel2DSet.from_string("#@ ",
+                                        " ##",
+                                        fill=Block(source="Z"))
+_SRS_Shapes_Z[3]=Pixel2DSet.from_string(" #",
+                                        "#@",
+                                        "# ",
+                                        fill=Block(source="Z"))
+_SRS_Compiled_Z=CompiledShape.compile_rotations(_SRS_Shapes_Z)
+
+_SRS_Kicks_I=(((0,0),(-1,0),(-1,1),(0,1)), #No kick
+              ((-1,0),(0,0),(1,1),(0,1)), #Kick 1
+               ((2,0),(0,0),(-2,1),(0,1)), #Kick 2
+               ((-1,0),(0,1),(1,0),(0,-1)), #Kick 3
+               ((2,0),(0,-2),(-2,0),(0,2))) #Kick 4
+
+_SRS_Shapes_I=[None]*4
+_SRS_Shapes_I[0]=Pixel2DSet.from_string("#@##",
+                                        fill=Block(source="I"))
+_SRS_Shapes_I[1]=Pixel2DSet.from_string("#",
+                                        "@",
+                                        "#",
+                                        "#",
+                                        fill=Block(source="I"))
+_SRS_Shapes_I[2]=Pixel2DSet.from_string("##@#",
+                                        fill=Block(source="I"))
+_SRS_Shapes_I[3]=Pixel2DSet.from_string("#",
+                                        "#",
+                                        "@",
+                                        "#",
+                                        fill=Block(source="I"))
+_SRS_Compiled_I=CompiledShape.compile_rotations(_SRS_Shapes_I)
+
+_SRS_Kicks_O=(((0,0),(0,-1),(-1,-1),(-1,0)),) #No kick
+_SRS_Shapes_O=[None]*4
+_SRS_Shapes_O[0]=Pixel2DSet.from_string("##",
+                                        "@#",
+                                        fill=Block(source="O"))
+_SRS_Shapes_O[1]=Pixel2DSet.from_string("@#",
+                                        "##",
+                                        fill=Block(source="O"))
+_SRS_Shapes_O[2]=Pixel2DSet.from_string("#@",
+                                        "##",
+                                        fill=Block(source="O"))
+_SRS_Shapes_O[3]=Pixel2DSet.from_string("##",
+                                        "#@",
+                                        fill=Block(source="O"))
+_SRS_Compiled_O=CompiledShape.compile_rotations(_SRS_Shapes_O)
+
+
+class SRS_J(SRS_Tetrimino):
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        
+    def shape(self):
+        return _SRS_Shapes_J[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        return _SRS_Compiled_J
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        return _SRS_Kicks_JLSTZ
+class SRS_L(SRS_Tetrimino):
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        
+    def shape(self):
+        return _SRS_Shapes_L[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        return _SRS_Compiled_L
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        return _SRS_Kicks_JLSTZ
+class SRS_S(SRS_Tetrimino):
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        
+    def shape(self):
+        return _SRS_Shapes_S[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        return _SRS_Compiled_S
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        return _SRS_Kicks_JLSTZ
+class SRS_T(SRS_Tetrimino):
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        
+    def shape(self):
+        return _SRS_Shapes_T[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        return _SRS_Compiled_T
+    @classmethod
+    def front_corners(cls):
+        return _SRS_Front_Corners_T
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        return _SRS_Kicks_JLSTZ
+class SRS_Z(SRS_Tetrimino):
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        
+    def shape(self):
+        return _SRS_Shapes_Z[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        return _SRS_Compiled_Z
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        return _SRS_Kicks_JLSTZ
+    
+class SRS_I(SRS_Tetrimino):
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        
+    def shape(self):
+        return _SRS_Shapes_I[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        return _SRS_Compiled_I
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        return _SRS_Kicks_I
+    
+class SRS_O(SRS_Tetrimino):
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        
+    def shape(self):
+        return _SRS_Shapes_O[self._rotation]
+    @classmethod
+    def compiled_shapes(cls):
+        return _SRS_Compiled_O
+    @classmethod
+    def _SRS_kick_offsets(cls):
+        return _SRS_Kicks_O
+SRS_Minos=(SRS_J,SRS_L,SRS_S,SRS_T,SRS_Z,SRS_I,SRS_O)
+# Kick translations for each offset table - see SRS_Tetrimino.compiled_kicks()
+_SRS_Compiled_Kicks={
+    _SRS_Kicks_JLSTZ:_compile_SRS_kicks(_SRS_Kicks_JLSTZ,_SRS_Kicks_180),
+    _SRS_Kicks_I:_compile_SRS_kicks(_SRS_Kicks_I,_SRS_Kicks_180),
+    _SRS_Kicks_O:_compile_SRS_kicks(_SRS_Kicks_O,_SRS_Kicks_180_None),
+    }
+# Looked up once here, so rotating never hashes an offset table.
+for _cls in SRS_Minos:
+    _cls._compiled_kicks=_SRS_Compiled_Kicks[_cls._SRS_kick_offsets()]
+del _cls
+
+class SevenBagRandomizer(BagRandomizer):
+    def __init__(self,seed=None):
+        super().__init__(SRS_Minos,seed)
+
+class Placement():
+    '''
+    A final lock position found by Playfield.enumerate_placements().
+        .piece_class .coords .rotation = where the mino locks
+        .cells = sorted tuple of the (x,y) cells it occupies
+        .path = tuple of Keys that gets it there from the start,
+                ending in Key.DROP_HARD
+        .spin = Spin type of locking there by this path (LineClear.spin)
+    Immutable, so placements can be shared, e.g. by a PlacementCache.
+    '''
+    __slots__=("piece_class","coords","rotation","cells","path","spin")
+
+    def __init__(self,piece_class,coords,rotation,cells,path,spin):
+        object.__setattr__(self,"piece_class",piece_class)
+        object.__setattr__(self,"coords",coords)
+        object.__setattr__(self,"rotation",rotation)
+        object.__setattr__(self,"cells",cells)
+        object.__setattr__(self,"path",path)
+        object.__setattr__(self,"spin",spin)
+
+    def __setattr__(self,name,value):
+        raise ImmutableModificationException
+    def __reduce__(self):
+        return (Placement,(self.piece_class,self.coords,self.rotation,self.cells,self.path,self.spin))
+    def __copy__(self):
+        return self
+    def __deepcopy__(self,memo):
+        return self
+
+    def with_prefix(self,*keys):
+        '''
+        The same placement, with keys pressed before its path.
+        '''
+        return Placement(self.piece_class,self.coords,self.rotation,self.cells,keys+self.path,self.spin)
+
+    def __repr__(self):
+        return F"Placement({self.piece_class.__name__},coords={self.coords},rotation={self.rotation},spin={self.spin})"
+
+
+class Spin(enum.IntEnum):
+    '''
+    Spin types, from Playfield.classify_spin(). NONE is falsy.
+    '''
+    NONE=0
+    TSPIN=1
+    TSPIN_MINI=2
+    ALLSPIN=3 # A non-T piece rotated into a spot it cannot move out of
+
+
+class LineClear():
+
+    def __init__(self):
+        self.lines=0
+        self.spin=Spin.NONE
+
+    def plus_line(self):
+        self.lines+=1
+
+    def activate_spin(self,spin=Spin.ALLSPIN):
+        self.spin=spin
+
+    @property
+    def empty(self):
+        return self.lines==0
+
+    def __str__(self):
+        s={
+            1:"Single",
+            2:"Double",
+            3:"Triple",
+            4:"QUADRUPLE"}.get(self.lines,"")
+        if self.spin==Spin.TSPIN:
+            s=("T-Spin "+s).strip()
+        elif self.spin==Spin.TSPIN_MINI:
+            s=("T-Spin Mini "+s).strip()
+        elif self.spin:
+            s+=" +TWIST"
+        return s
+
+# corner_bits() values with at least 3 corners filled
+_three_corner_masks=frozenset((0b0111,0b1011,0b1101,0b1110,0b1111))
+
+
+class Playfield():
+    def __init__(self,dim_x,dim_y):
+        self._dim_x=dim_x
+        self._dim_y=dim_y
+        self._matrix=BitboardMatrix(dim_x,dim_y)
+        self._matrix_view=None
+        self._matrix_version=0
+        self._active_minos=list()
+
+        
+
+    def add_activemino(self,mino):
+        mino.link_to_playfield(self)
+        self._active_minos.append(mino)
+        assert len(self._active_minos) <=1
+
+    def get_activemino(self):
+        if not self._active_minos:
+            return None
+        return self._active_minos[0]
+
+    def remove_activemino(self):
+        return self._active_minos.pop()
+
+    def get_matrix_state(self,*,player_filter=(lambda x:True),
+                         generate_ghost=False,
+                         include_active=False):
+        if self._matrix_view is None:
+            # Cached until the matrix changes.
+            self._matrix_view=MatrixView(self._matrix.snapshot())
+        r2d=self._matrix_view
+        if include_active:
+            for i in  self._active_minos:
+                if player_filter(i):
+
+                    if generate_ghost:
+                        r2d=r2d.composite_p2ds(i.get_ghost_blocks())
+                    minoblocks=i.get_blocks()
+                    r2d=r2d.composite_p2ds(minoblocks)
+
+        return r2d
+
+    def get_bitboard(self):
+        return self._matrix
+
+    def snapshot(self):
+        '''
+        Copy-on-write BitboardMatrix copy of the locked blocks.
+        Cheap to take, and safe to modify (e.g. for AI search).
+        '''
+        return self._matrix.snapshot()
+
+    @property
+    def matrix_version(self):
+        '''
+        Incremented every time the locked blocks change.
+        '''
+        return self._matrix_version
+
+    def fits(self,piece_class,x,y,rotation):
+        '''
+        Whether a piece_class mino at (x,y) in the given rotation would be inside
+        the matrix and clear of locked blocks. Nothing is created or moved.
+        '''
+        return self._matrix.fits(piece_class.compiled_shapes()[rotation],x,y)
+
+    def drop_distance(self,piece_class,x,y,rotation):
+        '''
+        How many rows a piece_class mino at (x,y) in the given rotation can fall.
+        '''
+        return self._matrix.drop_distance(piece_class.compiled_shapes()[rotation],x,y)
+
+    def classify_spin(self,piece_class,x,y,rotation,last_kick):
+        '''
+        Spin type of a piece_class mino locking at (x,y) in the given rotation.
+        last_kick is the (dx,dy) kick of its last movement if that was
+        a rotation, or None - only rotations can make spins.
+
+        Pieces with front_corners() (the T) use the 3-corner rule: 3 of the 4
+        diagonal corners filled is a T-spin if both front corners are,
+        or the rotation used a 1x2 kick (TST / fin kicks), and a mini otherwise.
+        Any other piece that cannot move left, right, up or down is an all-spin.
+        '''
+        if last_kick is None:
+            return Spin.NONE
+        front=piece_class.front_corners()
+        if front is not None:
+            corners=self._matrix.corner_bits(x,y)
+            if corners not in _three_corner_masks:
+                return Spin.NONE
+            kx,ky=last_kick
+            if corners&front[rotation]==front[rotation] or (abs(kx)==1 and abs(ky)==2):
+                return Spin.TSPIN
+            return Spin.TSPIN_MINI
+        cshape=piece_class.compiled_shapes()[rotation]
+        for dx,dy in ((1,0),(-1,0),(0,1),(0,-1)):
+            if self._matrix.fits(cshape,x+dx,y+dy):
+                return Spin.NONE
+        return Spin.ALLSPIN
+
+    def column_heights(self):
+        '''
+        Height of each column of locked blocks - see BitboardMatrix.heights.
+        '''
+        return self._matrix.heights
+
+    def zobrist_hash(self,include_active=False):
+        '''
+        64-bit Zobrist hash of the locked blocks.
+        If include_active, the active minos' type, position and rotation are mixed in.
+        '''
+        h=self._matrix.zobrist_hash
+        if include_active:
+            table=self._matrix.zobrist_table
+            for mino in self._active_minos:
+                if not mino.dead:
+                    h^=table.key("active",type(mino).__name__,mino.coords,mino.rotation)
+        return h
+
+    def _matrix_changed(self):
+        self._matrix_view=None
+        self._matrix_version+=1
+        
+    def update_matrix(self,newmat):
+        self._matrix=BitboardMatrix.from_r2d(newmat)
+        self._matrix_changed()
+    def gravity(self,n,t):
+        for am in self._active_minos:
+            am.gravity(n,t)
+
+    def line_clear(self,y):
+        self._matrix.clear_row(y)
+        self._matrix_changed()
+        
+    def check_line_clear(self,rows=None):
+        '''
+        Clear every full row and return a LineClear.
+        If rows is given, only those rows are checked -
+        when locking a mino, only the rows it touched can become full.
+        '''
+        lc=LineClear()
+        full=self._matrix.full_rows(rows)
+        if full:
+            self._matrix.clear_rows(full)
+            self._matrix_changed()
+        for y in full:
+            lc.plus_line()
+        return lc
+                
+
+
+    def enumerate_placements(self,piece_class,coords=None,rotation=0):
+        '''
+        Breadth-first search over every (coords, rotation, last kick) state
+        a mino of piece_class can reach from coords (default: the spawn position),
+        using the same _try_move/_rotate logic and SRS kicks as real input,
+        so tucks and spins are found. The last kick (None unless the last move
+        was a rotation) is part of the state, so a spot reached both by sliding
+        and by rotating is kept in both ways.
+        Moves are MOVE_LEFT, MOVE_RIGHT, ROTATE_LEFT, ROTATE_RIGHT and DROP_FIRM.
+        Each state is expanded once. Returns a list of Placement, one for each
+        distinct (set of cells, spin type) the mino can lock into,
+        with the shortest path.
+        '''
+        if coords is None:
+            coords=TetrisGame.spawn_coords
+        ms=self._matrix
+        probe=piece_class(coords,rotation)
+        probe.link_to_playfield(self)
+        if not ms.fits(probe.compiled_shape(),*coords):
+            return []
+
+        start=(coords,rotation,None)
+        parents={start:None} # state -> (previous state, key)
+        queue=collections.deque((start,))
+        placements={} # (cells, spin) -> Placement
+        while queue:
+            state=queue.popleft()
+            for ktype in _placement_keys:
+                probe._coords,probe._rotation,probe._last_kick=state
+                if ktype==Key.MOVE_LEFT:
+                    probe._try_move(-1,0,0)
+                elif ktype==Key.MOVE_RIGHT:
+                    probe._try_move(+1,0,0)
+                elif ktype==Key.ROTATE_LEFT:
+                    probe._rotate(-1,0)
+                elif ktype==Key.ROTATE_RIGHT:
+                    probe._rotate(+1,0)
+                elif ktype==Key.DROP_FIRM:
+                    probe.firm_drop(0)
+                new_state=(probe._coords,probe._rotation,probe._last_kick)
+                if new_state not in parents:
+                    parents[new_state]=(state,ktype)
+                    queue.append(new_state)
+
+            (x,y),r,last_kick=state
+            cshape=piece_class.compiled_shapes()[r]
+            if ms.fits(cshape,x,y-1):
+                continue # Not resting on anything
+            cells=tuple(((x+dx,y+dy) for dx,dy in cshape.offsets))
+            spin=self.classify_spin(piece_class,x,y,r,last_kick)
+            if (cells,spin) in placements:
+                continue
+
+            path=[]
+            prev=parents[state]
+            while prev is not None:
+                path.append(prev[1])
+                prev=parents[prev[0]]
+            path.reverse()
+            if path and path[-1]==Key.DROP_FIRM:
+                path.pop() # the hard drop does this anyway
+            path.append(Key.DROP_HARD)
+
+            placements[(cells,spin)]=Placement(piece_class,(x,y),r,cells,tuple(path),spin)
+        return list(placements.values())
+
+    def remove_mino(self,mino):
+        self._active_minos.remove(mino)
+    
+    def lock_mino(self,mino):
+        if mino not in self._active_minos:
+            raise Exception("what")
+
+        spin=mino.spin()
+        touched=self._matrix.lock(mino.get_blocks())
+        mino.die()
+        
+        self._matrix_changed()
+        lc=self.check_line_clear(touched)
+        if spin:
+            lc.activate_spin(spin)
+
+        return lc
+
+    def force_matrix_state(self,r2d):
+        self._matrix=BitboardMatrix.from_r2d(r2d)
+        self._matrix_changed()
+
+
+class Key(enum.Enum):
+    MOVE_LEFT=11
+    MOVE_RIGHT=12
+
+    ROTATE_LEFT=21
+    ROTATE_RIGHT=22
+    ROTATE_180=23
+
+    HOLD=31
+
+    DROP_HARD=41
+    DROP_FIRM=42
+    DROP_SOFT=43
+
+    KEY_DOWN=101
+    KEY_UP=102
+
+
+class GameEvent(enum.Enum):
+    SPAWN=1
+    GRAVITY=2
+    LOCKDOWN=3
+
+
+_event_phases={GameEvent.SPAWN:"engine.spawn",
+               GameEvent.GRAVITY:"engine.gravity",
+               GameEvent.LOCKDOWN:"engine.lockdown"}
+_no_phase=contextlib.nullcontext()
+
+
+class EventScheduler():
+    '''
+    Min-heap of timed events.
+    Each event is pending at most once - scheduling it again replaces
+    its previous time. Replaced and cancelled heap entries are
+    dropped lazily, when they reach the top of the heap.
+    '''
+    def __init__(self):
+        self._heap=[]
+        self._times={} # event -> currently scheduled time
+        self._seq=0 # tie-breaker, so equal times pop in scheduling order
+
+    def schedule(self,event,t):
+        if self._times.get(event)==t:
+            return
+        self._times[event]=t
+        heapq.heappush(self._heap,(t,self._seq,event))
+        self._seq+=1
+
+    def cancel(self,event):
+        self._times.pop(event,None)
+
+    def scheduled_time(self,event):
+        return self._times.get(event)
+
+    def _discard_stale(self):
+        heap=self._heap
+        while heap:
+            t,_,event=heap[0]
+            if self._times.get(event)==t:
+                return
+            heapq.heappop(heap)
+
+    def next_time(self):
+        '''
+        Time of the earliest pending event, or None.
+        '''
+        self._discard_stale()
+        if self._heap:
+            return self._heap[0][0]
+        return None
+
+    def pop_due(self,t):
+        '''
+        Remove and return (event, time) of the earliest event
+        scheduled at or before t, or None if there is no such event.
+        '''
+        self._discard_stale()
+        if self._heap and self._heap[0][0]<=t:
+            te,_,event=heapq.heappop(self._heap)
+            del self._times[event]
+            return (event,te)
+        return None
+
+
+_placement_keys=(Key.MOVE_LEFT,Key.MOVE_RIGHT,Key.ROTATE_LEFT,Key.ROTATE_RIGHT,Key.DROP_FIRM)
+_rotation_keys=(Key.ROTATE_LEFT,Key.ROTATE_RIGHT,Key.ROTATE_180)
+
+
+class PlacementCache():
+    '''
+    LRU cache of placement enumeration results, keyed by
+    (kind of query, board Zobrist hash, piece class, hold state).
+    One cache can be shared by many games, e.g. across search branches.
+
+    Memory is bounded by the total number of cached Placement objects:
+    least recently used entries are evicted until the total is at most
+    max_placements (the newest entry is always kept, even if it is bigger).
+    Counts hits, misses and evictions.
+    '''
+    def __init__(self,max_placements=100000):
+        if max_placements<=0:
+            raise ValueError("max_placements must be positive")
+        self._max_placements=max_placements
+        self._entries=collections.OrderedDict()
+        self._size=0
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        '''
+        Number of Placement objects currently cached.
+        '''
+        return self._size
+
+    @property
+    def max_placements(self):
+        return self._max_placements
+
+    def get(self,key,compute):
+        '''
+        Return the cached tuple for key, or call compute() to make it.
+        '''
+        try:
+            res=self._entries[key]
+        except KeyError:
+            pass
+        else:
+            self._entries.move_to_end(key)
+            self.hits+=1
+            return res
+
+        self.misses+=1
+        res=tuple(compute())
+        self._entries[key]=res
+        self._size+=len(res)
+        while self._size>self._max_placements and len(self._entries)>1:
+            _,evicted=self._entries.popitem(last=False)
+            self._size-=len(evicted)
+            self.evictions+=1
+        return res
+
+    def placements(self,playfield,piece_class,hold=None):
+        '''
+        Cached Playfield.enumerate_placements(piece_class) from the spawn position.
+        hold is any hashable description of the hold state, and becomes part of the key.
+        '''
+        ms=playfield.get_bitboard()
+        key=("piece",ms.zobrist_hash,ms.x,ms.y,piece_class,hold)
+        return self.get(key,lambda:playfield.enumerate_placements(piece_class))
+
+    def clear(self):
+        self._entries.clear()
+        self._size=0
+
+    def stats(self):
+        return {"entries":len(self._entries),"placements":self._size,
+                "hits":self.hits,"misses":self.misses,"evictions":self.evictions}
+
+
+class TetrisGame:
+    '''
+    A single game of Tetris.
+    The engine never reads the clock by itself - every call takes the
+    current time t (in seconds) as an argument. The UI feeds it time.time(),
+    while headless users may call step() and let the game keep its own
+    simulated clock.
+
+    Gravity ticks, lockdowns and spawns are events in an EventScheduler.
+    update(t) runs every event due by t in time order, each at its own
+    scheduled time, so the game jumps from one event to the next no
+    matter how far apart the calls to update() are.
+    '''
+    spawn_coords=(5,17)
+
+    def __init__(self,t=0.0,seed=None,recorder=None,timer=None):
+        self._gravity=1.5 #Blocks per second
+        self._last_gravity=t
+        # Gravity tick i happens at _gravity_origin+i/_gravity, computed rather
+        # than accumulated so that it does not depend on how often update() is called.
+        self._gravity_origin=t
+        self._gravity_tick=1 # Index of the next tick
+        self._lockdown_delay=1.0 #second
+        self._spawn_delay=0.0 #second
+        self._held_mino=None
+        self._hold_avail=True
+        self.sbr=SevenBagRandomizer(seed)
+        self.pf=Playfield(10,20)
+
+        #self.pf.force_matrix_state(_test_DT_cannon_r2d)
+
+        self._sim_t=t
+
+        self._clear_history=[]
+
+        self._events=EventScheduler()
+        self._events.schedule(GameEvent.SPAWN,t)
+        self._events.schedule(GameEvent.GRAVITY,self._gravity_time(1))
+
+        # Gets every key() and update() call - see replay.InputRecorder
+        self._recorder=recorder
+        if recorder is not None:
+            recorder.start(t,self.seed)
+
+        # Times the engine's internal steps - see frametimer.FrameTimer
+        self._timer=timer
+
+    def _phase(self,name):
+        if self._timer is None:
+            return _no_phase
+        return self._timer.phase(name)
+
+    def set_gravity(self,g):
+        self._gravity=g*60 #Blocks per 60fps frame
+        self._gravity_origin=self._last_gravity
+        self._gravity_tick=1
+        self._events.schedule(GameEvent.GRAVITY,self._gravity_time(1))
+
+    @property
+    def instant_gravity(self):
+        '''
+        True at 20G or more: minos fall to the bottom as soon as they spawn or move.
+        '''
+        return self._gravity>=20*60
+
+    def _gravity_time(self,i):
+        return self._gravity_origin+i/self._gravity
+
+    def _gravity_ticks(self,horizon,inclusive):
+        # Number of gravity ticks from the next one up to horizon. At least 1.
+        first=self._gravity_tick
+        def due(i):
+            ti=self._gravity_time(i)
+            return ti<horizon or (inclusive and ti==horizon)
+        n=max(1,int((horizon-self._gravity_time(first))*self._gravity))
+        while due(first+n):
+            n+=1
+        while n>1 and not due(first+n-1):
+            n-=1
+        return n
+
+    def _apply_gravity(self,t):
+        '''
+        Apply every gravity tick that is due by t as a single drop,
+        capped at the landing row. Ticks are only taken up to the next other
+        event, and up to the lockdown once the mino lands, so that events still
+        happen in order.
+        '''
+        first=self._gravity_tick
+        other=self._events.next_time()
+        if other is not None and other<=t:
+            n=self._gravity_ticks(other,False)
+        else:
+            n=self._gravity_ticks(t,True)
+
+        am=self.pf.get_activemino()
+        if am is not None and not am.dead:
+            dist=am.drop_distance()
+            if dist>0:
+                fallen=min(n,dist)
+                last_move=self._gravity_time(first+fallen-1)
+                am.gravity(fallen,last_move)
+                if fallen==dist:
+                    # Landed - later ticks wait until after the lockdown.
+                    n=min(n,self._gravity_ticks(last_move+self._lockdown_delay,False))
+
+        self._gravity_tick=first+n
+        self._last_gravity=self._gravity_time(first+n-1)
+        self._events.schedule(GameEvent.GRAVITY,self._gravity_time(first+n))
+
+    def _instant_drop(self,t):
+        am=self.pf.get_activemino()
+        if self.instant_gravity and am is not None and not am.dead:
+            am.firm_drop(t)
+
+    def key(self,t,ktype,etype=Key.KEY_DOWN):
+        if self._recorder is not None:
+            t=self._recorder.record_key(t,ktype)
+        am=self.pf.get_activemino()
+        if am is None or am.dead:
+            # Between minos - nothing to control.
+            return
+        with self._phase("engine.key"):
+            self._key(t,ktype)
+            self._instant_drop(t)
+            am=self.pf.get_activemino()
+            if am.dead:
+                self._on_locked(t,am)
+            self._sync_lockdown()
+
+    def _key(self,t,ktype):
+        if ktype==Key.MOVE_LEFT:
+            self.pf.get_activemino().input(t,left=True)
+        elif ktype==Key.MOVE_RIGHT:
+            self.pf.get_activemino().input(t,right=True)
+        elif ktype==Key.DROP_HARD:
+            self.pf.get_activemino().input(t,hard=True)
+        elif ktype==Key.DROP_FIRM:
+            self.pf.get_activemino().input(t,soft=True)
+        elif ktype==Key.ROTATE_LEFT:
+            self.pf.get_activemino().input(t,rotate_l=True)
+        elif ktype==Key.ROTATE_RIGHT:
+            self.pf.get_activemino().input(t,rotate_r=True)
+        elif ktype==Key.ROTATE_180:
+            self.pf.get_activemino().input(t,rotate_180=True)
+        elif ktype==Key.HOLD:
+            self.hold()
+
+    def update(self,t):
+        if self._recorder is not None:
+            t=self._recorder.record_update(t)
+        while True:
+            due=self._events.pop_due(t)
+            if due is None:
+                break
+            event,te=due
+            with self._phase(_event_phases[event]):
+                if event==GameEvent.SPAWN:
+                    self.new_mino()
+                    self._hold_avail=True
+                    self._instant_drop(te)
+                elif event==GameEvent.GRAVITY:
+                    self._apply_gravity(t)
+                elif event==GameEvent.LOCKDOWN:
+                    am=self.pf.get_activemino()
+                    am.lock()
+                    self._on_locked(te,am)
+                self._sync_lockdown()
+
+    def _on_locked(self,t,am):
+        mino_result=am.get_lineclear()
+        if not mino_result.empty:
+            self._clear_history.append((t,mino_result))
+            while len(self._clear_history)>100:
+                del self._clear_history[0]
+        self._events.schedule(GameEvent.SPAWN,t+self._spawn_delay)
+
+    def _sync_lockdown(self):
+        # Keep the lockdown event at lockdown_delay after the last movement.
+        am=self.pf.get_activemino()
+        if am is None or am.dead or am.last_movement is None:
+            self._events.cancel(GameEvent.LOCKDOWN)
+        else:
+            self._events.schedule(GameEvent.LOCKDOWN,am.last_movement+self._lockdown_delay)
+
+    def next_deadline(self):
+        '''
+        Earliest time at which update() can change the game state
+        without any key input - the next gravity tick, lockdown or spawn.
+        '''
+        return self._events.next_time()
+
+    def state_key(self):
+        '''
+        Cheap, comparable summary of the visible game state.
+        Changes whenever anything that would be drawn changes.
+        '''
+        am=self.pf.get_activemino()
+        if am is None:
+            am_key=None
+        else:
+            am_key=(id(am),am.dead,am.coords,am.rotation)
+        return (self.pf.matrix_version,am_key,self._held_mino,self.get_last_lc())
+
+    def state_hash(self,hold=False,bag=False,active=False):
+        '''
+        64-bit Zobrist hash of the matrix, for transposition tables
+        and deduplicating states. Optionally mixes in the held mino
+        (and whether hold is available), the position in the current bag,
+        and the active mino.
+        '''
+        h=self.pf.zobrist_hash(include_active=active)
+        table=self.pf.get_bitboard().zobrist_table
+        if hold:
+            held=None if self._held_mino is None else self._held_mino.__name__
+            h^=table.key("hold",held,self._hold_avail)
+        if bag:
+            h^=table.key("bag",self.sbr.bag_position)
+        return h
+
+    def step(self,actions=(),dt=0.0):
+        '''
+        Advance the game on simulated time.
+        All keys in actions are applied at the current simulated time,
+        then the clock is advanced by dt seconds and the game is updated.
+        Returns the new simulated time.
+        '''
+        for ktype in actions:
+            am=self.pf.get_activemino()
+            if am is None or am.dead:
+                # Spawn the next mino before applying the next key.
+                self.update(self._sim_t)
+            self.key(self._sim_t,ktype)
+        self._sim_t+=dt
+        self.update(self._sim_t)
+        return self._sim_t
+
+    @property
+    def sim_time(self):
+        return self._sim_t
+
+    def get_last_lc(self):
+        if len(self._clear_history)>0:
+            return self._clear_history[-1]
+        else:
+            return None
+
+    def hold(self):
+        if not self._hold_avail:
+            return False
+
+        current_mino=self.pf.get_activemino()
+        self.new_mino(self._held_mino)
+        self._hold_avail=False
+        self._held_mino=type(current_mino) # probably bad design
+
+
+    def enumerate_placements(self,cache=None):
+        '''
+        Every distinct placement of the current mino from the spawn position,
+        plus, if hold is available, every placement of the mino that
+        Key.HOLD would bring out (their paths start with Key.HOLD).
+        Pass a PlacementCache to reuse results for boards seen before.
+        '''
+        am=self.pf.get_activemino()
+        if am is None or am.dead:
+            return []
+        current=type(am)
+        if not self._hold_avail:
+            alternative=None
+        elif self._held_mino is not None:
+            alternative=self._held_mino
+        else:
+            alternative=self.sbr.peek(1)[0]
+
+        def compute():
+            res=self.pf.enumerate_placements(current)
+            if alternative is not None:
+                res.extend((p.with_prefix(Key.HOLD) for p in self.pf.enumerate_placements(alternative)))
+            return res
+
+        if cache is None:
+            return compute()
+        ms=self.pf.get_bitboard()
+        return list(cache.get(("game",ms.zobrist_hash,ms.x,ms.y,current,alternative),compute))
+
+    def new_mino(self,override_next=None):
+        if override_next is not None:
+            minoclass=override_next
+        else:
+            minoclass=self.sbr.generate_next()
+        mino=minoclass(self.spawn_coords,0)
+
+        if self.pf.get_activemino() is not None:
+            self.pf.remove_activemino()
+        self.pf.add_activemino(mino)
+
+    def get_matrix_r2d(self):
+        return self.pf.get_matrix_state(generate_ghost=True,
+                                include_active=True)
+    def get_held(self):
+        return self._held_mino
+
+    @property
+    def seed(self):
+        '''
+        Seed of this game's randomizer.
+        Two games with the same seed get the same sequence of minos.
+        '''
+        return self.sbr.seed
+
+    def get_nextqueue(self,n=5):
+        return self.sbr.peek(n)
+
+    @classmethod
+    def minoclass_to_r2d(cls,piece_class):
+        piece=piece_class((0,0),0)
+        p2ds=piece.get_blocks()
+        bbx=p2ds.get_boundingbox()
+        positive_p2ds=p2ds.translate(-bbx["X-"],-bbx["Y-"])
+        r2d=Raster2D.blank_fill(4,4,EMPTY_BLOCK)
+        r2d=r2d.composite_p2ds(positive_p2ds)
+        return r2d
+    def get_nextpreview(self,n):
+        res=[]
+        pieces=self.get_nextqueue(n)
+        for piece_class in pieces:
+            res.append(self.minoclass_to_r2d(piece_class))
+        return res
+
+
+def r2d_render_stdout(self, r2d):
+    def _b2t(self,block):
+        if block.solid:
+            return block.source[0].upper()
+        else:
+            return " "
+    res=''
+    res+="+"+"-"*r2d.x+"+"+"\n"
+    for y in range(r2d.y):
+        iy=r2d.y-y-1
+        res+="|"
+        for x in range(r2d.x):
+            coords=(x,iy)
+            block=r2d[coords]
+            res+=self._b2t(block)
+        res+="|"
+        res+="\n"
+    res+="+"+"-"*r2d.x+"+"
+    print(res)
+
+def r2d_render_curses(self, r2d, scr, x, y):
+    pass
+
+_test_DT_cannon_p2ds=Pixel2DSet.from_string(
+    "  ##      ",
+    "   #      ",
+    "## #######",
+    "#  #######",
+    "#   ######",
+    "## #######",
+    "@# #######"
+    )
+_test_DT_cannon_r2d=Raster2D.blank_fill(10,20,EMPTY_BLOCK).composite_p2ds(_test_DT_cannon_p2ds.translate(0,0))